@@ -8,98 +8,369 @@ Un fichier d'entrée (au format CSV) contenant l'ensemble des points à traiter
 #* ne pas ecraser les colonnes d'origine
 #* erreur conversion en float
 
+import collections
+import contextlib
+import copy
 import csv
-import functools
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import locale
 import logging
 import math
-import networkx as nx
+import operator
+import numpy as np
+import os
+import pickle
+import queue
+import shutil
 import sys
+import threading
+import time
 import xml.etree.ElementTree as ET
 
 LOG_FORMAT = "%(message)s"
-LOG_POINT_FREQUENCY = 10000
+DEFAULT_CHUNK_SIZE = 100000
+LOG_STATS_INTERVAL = 10  # seconds between two progress messages
+PROGRESS_INTERVAL = 0.2  # seconds between two calls of a progress callback
+BINARY_EXTENSIONS = ('.npy', '.npz', '.bin')  # .bin = raw little-endian float64 x, y, [z]
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+CHECKPOINT_TAIL_SIZE = 4096  # bytes before the checkpoint offset compared between two runs
+COMPRESSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma'}  # module by extension of compressed files
+COMPRESSION_MAGICS = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'lzma'}
+DECOMPRESSION_BLOCK_SIZE = 1 << 20
+REJECTS_SUFFIX = '.rejects.csv'
+SORT_CURVES = ('morton', 'hilbert')
+SORT_BITS = 20  # grid resolution (per axis) of the space-filling curves
+TILE_INDEX_SUFFIX = '.tiles.csv'
+VECTOR_DRIVERS = {'.shp': 'ESRI Shapefile', '.gpkg': 'GPKG'}  # fiona drivers of vector layers
+CACHE_FOLDER = os.path.join(os.path.expanduser('~'), '.cache', 'ModelerTools', 'ChangementReperes')
+CACHE_VERSION = 3  # to increment if the content of ReferenceFrameConfig changes
 
+_loaded_configs = {}  # path to xml file: ReferenceFrameConfig (used by transform_arrays)
 
-# Change function representation
-# Inspiration from: http://stackoverflow.com/questions/10875442/possible-to-change-a-functions-repr-in-python
-class reprwrapper(object):
-    def __init__(self, repr, func):
-        self._repr = repr
-        self._func = func
-        functools.update_wrapper(self, func)
 
-    def __call__(self, *args, **kw):
-        return self._func(*args, **kw)
-
-    def __repr__(self):
-        return self._repr(self._func)
+class ReferenceFrameError(Exception):
+    """Invalid configuration or impossible change of reference frame"""
 
 
-def withrepr(reprfun):
-    def _wrap(func):
-        return reprwrapper(reprfun, func)
-    return _wrap
+class TransformCancelled(Exception):
+    """Run stopped between two blocks at the request of the user (see TransformStats.cancel_event)"""
 
 
-class Point:
+class AffineTransformation:
     """
-    Point
+    Affine transformation applied on coordinate arrays
     Attributes:
-    * x = x coordinate
-    * y = y coordinate
-    * [z = z coordinate]
+    * matrix = homogeneous 3x3 matrix of the horizontal transformation (x, y)
+    * kv = vertical ratio
+    * dz = vertical offset (applied after kv)
+    * label = description used for logging
+
+    Every elementary transformation (translation, rotation, homothecy) is affine,
+    so a chain of them is composed once into a single AffineTransformation.
     """
-    def __init__(self, x, y, z=None):
+    def __init__(self, matrix=None, kv=1.0, dz=0.0, label="identité"):
         """
-        >>> Point(10, 50)
-        <Point (10, 50)>
-        >>> Point(10, 50).x
-        10
+        >>> AffineTransformation()
+        <Transformation: identité>
         """
-        self.x = x
-        self.y = y
-        if z is not None:
-            self.z = z
-        else:
-            self.z = None
+        self.matrix = np.identity(3) if matrix is None else np.asarray(matrix, dtype=np.float64)
+        self.kv = kv
+        self.dz = dz
+        self.label = label
+
+    @staticmethod
+    def translation(dx, dy, dz=0):
+        """Translation of vector (dx, dy, dz)"""
+        matrix = np.array([[1., 0., dx],
+                           [0., 1., dy],
+                           [0., 0., 1.]])
+        return AffineTransformation(matrix, 1.0, dz, "translate ({})".format([dx, dy, dz]))
+
+    @staticmethod
+    def rotation(angle_deg, xc, yc):
+        """Rotation of center (xc, yc) with an angle in degree (anti-clockwise)"""
+        angle_rad = math.radians(angle_deg)
+        cos, sin = math.cos(angle_rad), math.sin(angle_rad)
+        matrix = np.array([[cos, -sin, xc - cos*xc + sin*yc],
+                           [sin, cos, yc - sin*xc - cos*yc],
+                           [0., 0., 1.]])
+        return AffineTransformation(matrix, 1.0, 0.0, "rotate ({})".format([angle_deg, xc, yc]))
 
-    def translate(self, dx, dy, dz=0):
+    @staticmethod
+    def homothecy(kh, kv, xc, yc):
+        """Homothecy of center (xc, yc) with horizontal and vertical ratios"""
+        matrix = np.array([[kh, 0., xc*(1 - kh)],
+                           [0., kh, yc*(1 - kh)],
+                           [0., 0., 1.]])
+        return AffineTransformation(matrix, kv, 0.0, "homothecy ({})".format([kh, kv, xc, yc]))
+
+    def then(self, other):
         """
-        Translate point with vector (dx, dy)
+        Return the transformation applying `self` followed by `other`
 
-        >>> Point(10, 50).translate(20, 4)
+        >>> t = AffineTransformation.translation(1, 2).then(AffineTransformation.homothecy(2, 3, 0, 0))
+        >>> t.apply(np.array([0.]), np.array([0.]), np.array([1.]))
+        (array([2.]), array([4.]), array([3.]))
         """
-        self.x = self.x + dx
-        self.y = self.y + dy
-        if self.z:  # has z
-            self.z = self.z + dz
+        return AffineTransformation(
+            np.dot(other.matrix, self.matrix),
+            other.kv*self.kv,
+            other.kv*self.dz + other.dz,
+            "{} -> {}".format(self.label, other.label)
+        )
 
-    def rotate(self, angle_deg, xc, yc):
+    @staticmethod
+    def compose(transformations):
+        """Fuse a sequence of transformations (applied in order) into a single one"""
+        fused = AffineTransformation()
+        for transformation in transformations:
+            fused = fused.then(transformation)
+        return fused
+
+    def apply(self, x, y, z=None):
         """
-        >>> Point(10, 50).rotate(50, 0, 10)
+        Apply transformation on coordinate arrays (x, y, [z]) and return new arrays
+        z is None if it is not given
         """
-        angle_rad = math.radians(angle_deg)
-        x = xc + (self.x - xc)*math.cos(angle_rad) - (self.y - yc)*math.sin(angle_rad)  # temporary variable
-        self.y = yc + (self.x - xc)*math.sin(angle_rad) + (self.y - yc)*math.cos(angle_rad)
-        self.x = x
+        (a, b, c), (d, e, f) = self.matrix[:2]
+        x_new = a*x + b*y + c
+        y_new = d*x + e*y + f
+        z_new = None if z is None else self.kv*z + self.dz
+        return x_new, y_new, z_new
 
-    def homothecy(self, kh, kv, xc, yc):
-        """Homothety"""
-        self.x = xc + kh*(self.x - xc)
-        self.y = yc + kh*(self.y - yc)
-        if self.z:
-            self.z = kv*self.z
+    def apply_to_points(self, points, out=None):
+        """
+        Apply transformation on an array of points (n rows, columns x, y, [z])
+        The result is written in `out` (which can be `points` itself to transform in place) and returned
+        """
+        if out is None:
+            out = np.empty_like(points, dtype=np.float64)
+        x, y, z = self.apply(points[:, 0], points[:, 1], points[:, 2] if points.shape[1] == 3 else None)
+        out[:, 0] = x
+        out[:, 1] = y
+        if z is not None:
+            out[:, 2] = z
+        return out
+
+    def apply_compact(self, offsets, origin, out=None):
+        """
+        Apply transformation on compact points: float32 `offsets` (n rows, columns x, y, [z]) from a float64 `origin`
+        The origin is transformed in float64 and the offsets only by the linear part (in float32), so that the
+        precision of the result depends on the extent of the points and not on their distance to the frame origin.
+        Returns (offsets, origin) of the result, offsets are written in `out` if given (can be `offsets` itself)
+
+        >>> t = AffineTransformation.translation(1e6, 0).then(AffineTransformation.homothecy(2, 3, 0, 0))
+        >>> t.apply_compact(np.array([[0.5, 1., 1.]], dtype=np.float32), np.array([1e6, 0., 10.]))
+        (array([[1., 2., 3.]], dtype=float32), array([4.e+06, 0.e+00, 3.e+01]))
+        """
+        new_origin = np.array([value for value in self.apply(*origin) if value is not None])
+        (a, b), (d, e) = self.matrix[:2, :2].astype(np.float32)
+        if out is None:
+            out = np.empty_like(offsets, dtype=np.float32)
+        x, y = offsets[:, 0], offsets[:, 1]
+        x_new = a*x + b*y
+        y_new = d*x + e*y
+        out[:, 0] = x_new
+        out[:, 1] = y_new
+        if offsets.shape[1] == 3:
+            out[:, 2] = np.float32(self.kv)*offsets[:, 2]
+        return out, new_origin
+
+    def is_close(self, other, rtol=1e-9, atol=1e-6):
+        """Check if both transformations give the same results (within tolerances)"""
+        return np.allclose(self.matrix, other.matrix, rtol=rtol, atol=atol) and \
+            math.isclose(self.kv, other.kv, rel_tol=rtol, abs_tol=atol) and \
+            math.isclose(self.dz, other.dz, rel_tol=rtol, abs_tol=atol)
 
     def __repr__(self):
-        return "<Point ({}, {})>".format(self.x, self.y)
+        return "<Transformation: {}>".format(self.label)
+
+
+class FrameGraph:
+    """
+    Minimal directed graph of reference frames (networkx is too long to import for a command line tool)
+    Attributes:
+    * adj = {frame: {next frame: edge attributes}}
+    """
+    def __init__(self):
+        self.adj = {}
+
+    def add_node(self, node):
+        self.adj.setdefault(node, {})
+
+    def add_edge(self, node_from, node_to, **attributes):
+        self.add_node(node_from)
+        self.add_node(node_to)
+        self.adj[node_from][node_to] = attributes
+
+    def nodes(self):
+        return list(self.adj)
+
+
+class FrameResolver:
+    """
+    Resolve the path and the fused transformation between two reference frames
+    Attributes:
+    * graph = graph of reference frames (edges in both directions)
+    * parent, depth, root = spanning forest of the graph (parent is None for roots)
+    * from_root = composed transformation from the root of its tree to each frame
+    * inconsistent_cycles = list of (frames, edges of its biconnected block) for each cycle whose transformations do
+    not compose to identity
+
+    The graph is walked only once. An edge outside the spanning forest closes a cycle: if going
+    round this cycle is the identity, both ways are equivalent and the cycle is harmless.
+    Otherwise, every change of reference frame crossing the biconnected block of this cycle is ambiguous (another
+    path may go round the cycle).
+    Resolved pairs (source, target) are memoized.
+
+    >>> graph = FrameGraph()
+    >>> for r1, r2, dx in [('r', 'u', 0), ('u', 'v', 1), ('r', 'x', 0), ('r', 'y', 0), ('u', 'x', 0), ('v', 'y', 0),
+    ...                    ('x', 'y', 100), ('r', 'w', 5)]:
+    ...     graph.add_edge(r1, r2, function=[AffineTransformation.translation(dx, 0)])
+    ...     graph.add_edge(r2, r1, function=[AffineTransformation.translation(-dx, 0)])
+    >>> FrameResolver(graph).resolve('u', 'v')  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    ReferenceFrameError: Plusieurs suites de transformations possibles pour u->v
+    >>> FrameResolver(graph).resolve('w', 'r')[0]
+    ['w', 'r']
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.parent = {}
+        self.depth = {}
+        self.root = {}
+        self.from_root = {}
+        self.inconsistent_cycles = []
+        self._cache = {}
+        self._build()
+
+    def _build(self):
+        non_tree_edges = []
+        for root in self.graph.nodes():
+            if root in self.parent:
+                continue
+            self.parent[root] = None
+            self.depth[root] = 0
+            self.root[root] = root
+            self.from_root[root] = AffineTransformation()
+            queue = collections.deque([root])
+            while queue:
+                r1 = queue.popleft()
+                for r2 in self.graph.adj[r1]:
+                    if r2 not in self.parent:
+                        self.parent[r2] = r1
+                        self.depth[r2] = self.depth[r1] + 1
+                        self.root[r2] = root
+                        self.from_root[r2] = self.from_root[r1].then(self._edge_transformation(r1, r2))
+                        queue.append(r2)
+                    elif r2 != self.parent[r1] and self.depth[r2] >= self.depth[r1] and (r2, r1) not in non_tree_edges:
+                        non_tree_edges.append((r1, r2))
+
+        # Check consistency of each cycle closed by a non-tree edge
+        blocks = None
+        for r1, r2 in non_tree_edges:
+            if not self.from_root[r1].then(self._edge_transformation(r1, r2)).is_close(self.from_root[r2]):
+                if blocks is None:
+                    blocks = self._biconnected_blocks()
+                block_edges = next(edges for edges in blocks if frozenset((r1, r2)) in edges)
+                self.inconsistent_cycles.append((self._tree_path(r1, r2), block_edges))
+
+    def _biconnected_blocks(self):
+        """Return the list of biconnected blocks of the graph (sets of edges), iterative Hopcroft-Tarjan algorithm"""
+        blocks = []
+        index = {}
+        low = {}
+        for root in self.graph.nodes():
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            edge_stack = []
+            stack = [(root, None, iter(self.graph.adj[root]))]
+            while stack:
+                r1, parent, neighbours = stack[-1]
+                for r2 in neighbours:
+                    if r2 == parent or r2 == r1:
+                        continue
+                    if r2 not in index:
+                        index[r2] = low[r2] = len(index)
+                        edge_stack.append(frozenset((r1, r2)))
+                        stack.append((r2, r1, iter(self.graph.adj[r2])))
+                        break
+                    elif index[r2] < index[r1]:
+                        # Back edge
+                        low[r1] = min(low[r1], index[r2])
+                        edge_stack.append(frozenset((r1, r2)))
+                else:
+                    stack.pop()
+                    if parent is not None:
+                        low[parent] = min(low[parent], low[r1])
+                        if low[r1] >= index[parent]:
+                            # `parent` separates the block of the edge parent-r1 from the rest of the graph
+                            tree_edge = frozenset((parent, r1))
+                            block = set()
+                            while True:
+                                edge = edge_stack.pop()
+                                block.add(edge)
+                                if edge == tree_edge:
+                                    break
+                            blocks.append(block)
+        return blocks
+
+    def _edge_transformation(self, r1, r2):
+        return AffineTransformation.compose(self.graph.adj[r1][r2]['function'])
 
     @staticmethod
-    def auto_fun(method_name, args, kwargs={}):
-        @withrepr(lambda x: "<Transformation: {} ({})>".format(method_name, args))
-        def fun(point):
-            """point <Point>"""
-            return getattr(point, method_name)(*args, **kwargs)
-        return fun
+    def _path_edges(path):
+        return {frozenset(edge) for edge in zip(path[:-1], path[1:])}
+
+    def _tree_path(self, source, target):
+        """Path between two frames of the same tree"""
+        head, tail = [source], [target]
+        while head[-1] != tail[-1]:
+            if self.depth[head[-1]] >= self.depth[tail[-1]]:
+                head.append(self.parent[head[-1]])
+            else:
+                tail.append(self.parent[tail[-1]])
+        return head + tail[-2::-1]
+
+    def _resolve(self, source, target):
+        """Return (path, transformation, frames of a crossed inconsistent cycle or None)"""
+        if self.root[source] != self.root[target]:
+            return None, None, None
+        path = self._tree_path(source, target)
+        edges = FrameResolver._path_edges(path)
+        for frames, cycle_edges in self.inconsistent_cycles:
+            if edges & cycle_edges:
+                return path, None, frames
+        transformations = []
+        for r1, r2 in zip(path[:-1], path[1:]):
+            transformations.extend(self.graph.adj[r1][r2]['function'])
+        return path, AffineTransformation.compose(transformations), None
+
+    def resolve_all(self):
+        """Resolve every pair of reference frames (to be stored in the cache)"""
+        for source in self.parent:
+            for target in self.parent:
+                if (source, target) not in self._cache:
+                    self._cache[(source, target)] = self._resolve(source, target)
+
+    def resolve(self, source, target):
+        """
+        Return the path (list of frames) and the fused transformation from `source` to `target`
+        Path is None if no change of reference frame is possible
+        """
+        try:
+            path, transformation, cycle_frames = self._cache[(source, target)]
+        except KeyError:
+            path, transformation, cycle_frames = self._cache[(source, target)] = self._resolve(source, target)
+        if cycle_frames is not None:
+            raise ReferenceFrameError("""Cycle de transformations incohérent : {}
+    ERREUR: Plusieurs suites de transformations possibles pour {}->{}""".format(cycle_frames, source, target))
+        return path, transformation
 
 
 class ReferenceFrameConfig:
@@ -109,13 +380,17 @@ class ReferenceFrameConfig:
     - root
     - graph
     - _logger
+
+    A compiled configuration (frames, transformations and resolved changes of reference frame)
+    is stored in CACHE_FOLDER by `load`, keyed by the hash of the xml content.
     """
     def __init__(self, config_xml, logger):
         """Parse xml configuration file"""
         tree = ET.parse(config_xml)
         self.root = tree.getroot()
-        self.graph = nx.DiGraph()
+        self.graph = FrameGraph()
         self._logger = logger
+        self._resolver = None
 
         reference_frames = self.root.find('ReferenceFrames')
         self.reference_frames_dict = {}
@@ -128,10 +403,10 @@ class ReferenceFrameConfig:
                 )
                 self.graph.add_node(attrib['id'])
                 if attrib['id'] in self.reference_frames_dict.keys():
-                    sys.exit("Le référentiel '{}' existe déjà".format(attrib['id']))
+                    raise ReferenceFrameError("Le référentiel '{}' existe déjà".format(attrib['id']))
                 self.reference_frames_dict[attrib['id']] = attrib['name']
         else:
-            sys.exit("La balise 'ReferenceFrames' est manquante ou vide")
+            raise ReferenceFrameError("La balise 'ReferenceFrames' est manquante ou vide")
 
     def get_transformations(self):
         changes_in_referece_frames = self.root.find('ChangesInReferenceFrames')
@@ -160,21 +435,21 @@ class ReferenceFrameConfig:
                             dz = float(transf.attrib['z'])
                         except KeyError:
                             dz = 0
-                        function_processes.append(Point.auto_fun("translate", [dx, dy, dz]))
-                        reverse_function_processes.append(Point.auto_fun("translate", [-dx, -dy, -dz]))
+                        function_processes.append(AffineTransformation.translation(dx, dy, dz))
+                        reverse_function_processes.append(AffineTransformation.translation(-dx, -dy, -dz))
 
                     # Rotation of center (xc,yc) and with an angle in degree (anti-clockwise)
                     elif transf.tag == "Rotation":
                         try:
                             angle = float(transf.attrib['angle'])
                         except KeyError:
-                            sys.exit("L'angle de la rotation (attribut 'angle') n'est pas renseigné")
+                            raise ReferenceFrameError("L'angle de la rotation (attribut 'angle') n'est pas renseigné")
                         try:
                             xc, yc = (float(x) for x in transf.attrib['center'].split(','))
                         except KeyError:
                             xc, yc = (0, 0)
-                        function_processes.append(Point.auto_fun("rotate", [angle, xc, yc]))
-                        reverse_function_processes.append(Point.auto_fun("rotate", [-angle, xc, yc]))
+                        function_processes.append(AffineTransformation.rotation(angle, xc, yc))
+                        reverse_function_processes.append(AffineTransformation.rotation(-angle, xc, yc))
 
                     # Homothecy of center (x, yc) with a given ratio (|ratio|>1 => enlargement)
                     elif transf.tag == "Homothecy":
@@ -192,17 +467,17 @@ class ReferenceFrameConfig:
                             xc, yc = (float(x) for x in transf.attrib['center'].split(','))
                         except KeyError:
                             xc, yc = (0, 0)
-                        function_processes.append(Point.auto_fun("homothecy", [kh, kv, xc, yc]))
-                        reverse_function_processes.append(Point.auto_fun("homothecy", [1/kh, 1/kv, xc, yc]))
+                        function_processes.append(AffineTransformation.homothecy(kh, kv, xc, yc))
+                        reverse_function_processes.append(AffineTransformation.homothecy(1/kh, 1/kv, xc, yc))
                     else:
-                        sys.exit("La transformation '{}' est inconnue".format(transf.tag))
+                        raise ReferenceFrameError("La transformation '{}' est inconnue".format(transf.tag))
 
                 # Check if nodes are in tag 'ReferenceFrames'
                 # (This step is necessary because otherwise add_edge function would add nodes, but some information will be missing)
                 if attrib['from'] not in self.reference_frames_dict.keys():
-                    sys.exit("Le référentiel '{}' n'a pas de balise 'ReferenceFrame'".format(attrib['from']))
+                    raise ReferenceFrameError("Le référentiel '{}' n'a pas de balise 'ReferenceFrame'".format(attrib['from']))
                 if attrib['to'] not in self.reference_frames_dict.keys():
-                    sys.exit("Le référentiel '{}' n'a pas de balise 'ReferenceFrame'".format(attrib['to']))
+                    raise ReferenceFrameError("Le référentiel '{}' n'a pas de balise 'ReferenceFrame'".format(attrib['to']))
 
                 # from -> to : stack of successive functions
                 self.graph.add_edge(
@@ -219,7 +494,82 @@ class ReferenceFrameConfig:
                     function=reverse_function_processes
                 )
         else:
-            sys.exit("La balise 'ChangesInReferenceFrames' est manquante ou vide")
+            raise ReferenceFrameError("La balise 'ChangesInReferenceFrames' est manquante ou vide")
+
+    def get_resolver(self):
+        if self._resolver is None:
+            self._resolver = FrameResolver(self.graph)
+        return self._resolver
+
+    def resolve(self, source, target):
+        """Path and fused transformation from `source` to `target` (see FrameResolver.resolve)"""
+        return self.get_resolver().resolve(source, target)
+
+    def find_transformation(self, source, target):
+        """
+        Return the path (list of frames) and the fused transformation from `source` to `target`
+        Raise ReferenceFrameError if the change of reference frame is not possible
+        """
+        if source not in self.graph.adj:
+            raise ReferenceFrameError("Le référentiel en entrée '{}' n'existe pas".format(source))
+        if target not in self.graph.adj:
+            raise ReferenceFrameError("Le référentiel en sortie '{}' n'existe pas".format(target))
+        path, transformation = self.resolve(source, target)
+        if path is None:
+            raise ReferenceFrameError("Aucun changement de possible repère entre '{}' et '{}'".format(source, target))
+        return path, transformation
+
+    def transform_arrays(self, x, y, z, source, target):
+        """Return transformed coordinate arrays (x, y, z) from `source` to `target` (z can be None)"""
+        _, transformation = self.find_transformation(source, target)
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        z = None if z is None else np.asarray(z, dtype=np.float64)
+        return transformation.apply(x, y, z)
+
+    def __getstate__(self):
+        # xml tree is only needed by get_transformations and the logger is given again by `load`
+        state = self.__dict__.copy()
+        state['root'] = None
+        state['_logger'] = None
+        return state
+
+    @staticmethod
+    def load(config_xml, logger, use_cache=True):
+        """
+        Return a compiled ReferenceFrameConfig (with all transformations resolved)
+        The compiled configuration is read from the cache if the xml content is unchanged,
+        otherwise the xml file is parsed and the result is stored in the cache.
+        """
+        with open(config_xml, 'rb') as filein:
+            content = filein.read()
+        cache_path = os.path.join(CACHE_FOLDER, "{}.pickle".format(
+            hashlib.sha256(str(CACHE_VERSION).encode() + content).hexdigest()))
+
+        if use_cache:
+            try:
+                with open(cache_path, 'rb') as filein:
+                    config = pickle.load(filein)
+                config._logger = logger
+                logger.debug("Configuration des repères lue depuis le cache {}".format(cache_path))
+                return config
+            except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+                pass
+
+        config = ReferenceFrameConfig(io.BytesIO(content), logger)
+        config.get_transformations()
+        config.get_resolver().resolve_all()
+
+        if use_cache:
+            try:
+                os.makedirs(CACHE_FOLDER, exist_ok=True)
+                tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+                with open(tmp_path, 'wb') as fileout:
+                    pickle.dump(config, fileout, pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                logger.warn("Impossible d'écrire le cache de configuration : {}".format(e))
+        return config
 
 
 def get_required_attributes(instance_label, instance, attributes):
@@ -228,113 +578,1592 @@ def get_required_attributes(instance_label, instance, attributes):
         try:
             attr_dict[attr] = instance.attrib[attr]
         except KeyError:
-            sys.exit("{} n'a pas d'attribut '{}'".format(instance_label, attr))
+            raise ReferenceFrameError("{} n'a pas d'attribut '{}'".format(instance_label, attr))
     return attr_dict
 
 
-def launch_main(args, logger):
-    ref_frame_config = ReferenceFrameConfig(args.config_xml, logger)
-    ref_frame_config.get_transformations()
-    ref_frame_graph = ref_frame_config.graph
+class TransformStats:
+    """
+    Timers and counters of a run, logged periodically and summarized at the end
+    Attributes:
+    * timings = {stage: cumulated time in seconds}
+    * counters = {counter: number of rows}
+    * log_interval = minimum time in seconds between two progress messages (0 to disable them)
+    * progress_callback = function called with the `progress()` dictionary at most every PROGRESS_INTERVAL seconds
+    * cancel_event = event (threading or multiprocessing) stopping the run at the next block when it is set
+    """
+    STAGES = ('config', 'resolve', 'parse', 'transform', 'format', 'sort', 'write')
+    COUNTERS = ('rows_parsed', 'rows_transformed', 'rows_written', 'rows_rejected')
 
-    # Check if reference frames exist
-    logger.info("Liste des repères: {}".format(ref_frame_graph.nodes()))
-    if args.source not in ref_frame_graph.nodes():
-        sys.exit("Le référentiel en entrée '{}' n'existe pas".format(args.source))
-    if args.target not in ref_frame_graph.nodes():
-        sys.exit("Le référentiel en sortie '{}' n'existe pas".format(args.target))
+    def __init__(self, log_interval=LOG_STATS_INTERVAL, progress_callback=None, cancel_event=None):
+        self.timings = dict.fromkeys(TransformStats.STAGES, 0.0)
+        self.counters = dict.fromkeys(TransformStats.COUNTERS, 0)
+        self.log_interval = log_interval
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        self._input = None
+        self._input_size = None
+        self._start = time.perf_counter()
+        self._last_log = self._start
+        self._last_progress = self._start
 
-    # Find path from source to target
-    all_path = list(nx.all_simple_paths(ref_frame_graph, args.source, args.target))
+    def __getstate__(self):
+        # Opened input and events are only used by the process running the engine
+        state = self.__dict__.copy()
+        state.update(progress_callback=None, cancel_event=None, _input=None)
+        return state
 
-    if len(all_path)==0:
-        # No path found
-        sys.exit("Aucun changement de possible repère entre '{}' et '{}'".format(args.source, args.target))
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Context manager adding the time spent in the block to `stage`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] += time.perf_counter() - start
 
-    elif len(all_path)==1:
-        # Path is unique
-        path = all_path[0]
-        logger.info("Recherche des transformations pour le changement de repère '{}'->'{}' :".format(args.source, args.target))
-        for r1, r2 in zip(path[:-1], path[1:]):
-            logger.info("> Changement '{}'->'{}'".format(r1, r2))
-            for transformation in ref_frame_graph.adj[r1][r2]['function']:
-                logger.info("    - {}".format(transformation))
+    def count(self, counter, nb_rows):
+        self.counters[counter] += nb_rows
 
-        # Compute transformation over each line of the input file
-        with open(args.inname_csv, 'r', newline='') as in_csv:
-            csv_reader = csv.DictReader(in_csv, delimiter=args.sep)
+    def merge(self, other):
+        """Add timings and counters of `other` (e.g. computed in another process)"""
+        for stage, duration in other.timings.items():
+            self.timings[stage] += duration
+        for counter, nb_rows in other.counters.items():
+            self.counters[counter] += nb_rows
 
-            # Check x and y column existancy
-            if args.x not in csv_reader.fieldnames:
-                sys.exit("La colonne '{}' n'est pas dans le fichier '{}'".format(args.x, args.inname_csv))
-            if args.y not in csv_reader.fieldnames:
-                sys.exit("La colonne '{}' n'est pas dans le fichier '{}'".format(args.y, args.inname_csv))
+    def elapsed(self):
+        return time.perf_counter() - self._start
 
-            mode = 'w' if args.force else 'x'
-            with open(args.outname_csv, mode, newline='') as out_csv:
-                logger.info("Début écriture {}".format(args.outname_csv))
-                csv_writer = csv.DictWriter(out_csv, delimiter=args.sep, fieldnames=csv_reader.fieldnames)
-                csv_writer.writeheader()
+    def watch_input(self, in_csv, path):
+        """Report progress in bytes of an opened CSV file (not for compressed files, whose size is not known)"""
+        self._input = in_csv
+        self._input_size = os.path.getsize(path) if get_compression(path, read=True) is None else None
+
+    def progress(self):
+        """Return the progress of the run: rows, rate, bytes read (None if unknown) and estimated remaining time"""
+        elapsed = self.elapsed()
+        bytes_read = None
+        if self._input is not None and self._input_size is not None:
+            try:
+                bytes_read = self._input.buffer.tell()
+            except (AttributeError, OSError, ValueError):
+                pass
+        eta = None
+        if bytes_read:
+            eta = (self._input_size - bytes_read)*elapsed/bytes_read
+        return {
+            'rows': self.counters['rows_written'],
+            'rows_per_s': self.counters['rows_written']/elapsed if elapsed > 0 else 0.,
+            'bytes_read': bytes_read,
+            'bytes_total': self._input_size,
+            'eta_s': eta,
+        }
+
+    def log_progress(self, logger):
+        """
+        Called after each block: log number of rows and rate if the last message is older than `log_interval`,
+        call `progress_callback` and raise TransformCancelled if `cancel_event` is set
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise TransformCancelled("Traitement annulé")
+        now = time.perf_counter()
+        if self.progress_callback is not None and now - self._last_progress >= PROGRESS_INTERVAL:
+            self._last_progress = now
+            self.progress_callback(self.progress())
+        if self.log_interval and now - self._last_log >= self.log_interval:
+            self._last_log = now
+            logger.info("{} lignes traitées ({:.0f} lignes/s)".format(
+                self.counters['rows_written'], self.counters['rows_written']/(now - self._start)))
+
+    def summary(self):
+        elapsed = self.elapsed()
+        return {
+            'elapsed_s': elapsed,
+            'rows_per_s': self.counters['rows_written']/elapsed if elapsed > 0 else None,
+            'counters': dict(self.counters),
+            'timings_s': dict(self.timings),
+        }
 
-                def float_from_row(row, item):
+    def log_summary(self, logger):
+        summary = self.summary()
+        logger.info("Durée totale : {:.3f}s ({:.0f} lignes/s)".format(summary['elapsed_s'], summary['rows_per_s'] or 0))
+        logger.info("    - " + ", ".join("{} : {:.3f}s".format(stage, duration)
+                                         for stage, duration in summary['timings_s'].items()))
+        logger.info("    - " + ", ".join("{} : {}".format(counter, nb_rows)
+                                         for counter, nb_rows in summary['counters'].items()))
+
+    def write_json(self, path):
+        with open(path, 'w') as fileout:
+            json.dump(self.summary(), fileout, indent=2)
+
+
+class RowRejects:
+    """
+    Rows set aside instead of stopping the run: coordinates which are not numbers or missing, or non-finite results
+    They are written into a CSV file (columns: row number, reason, original row) and counted by reason. Rejects of a
+    block are kept until the next block is parsed (or `close`), to be written in row order.
+    Attributes:
+    * first_row = number of the first row read (1 for the first row after the header)
+    * block_rows = row numbers of the rows of the last block returned by `parse_block`
+    * counts = {reason: number of rows}
+    """
+    def __init__(self, path, sep, mode='w', first_row=1):
+        self.path = path
+        self.first_row = first_row
+        self.block_rows = None
+        self.counts = collections.Counter()
+        self._pending = []  # (row number, reason, row) of the current block
+        self._row_formatter = csv.writer(RowFormatter(), delimiter=sep)
+        self._file = open(path, mode, newline='')
+        self._writer = csv.writer(self._file, delimiter=sep)
+        if mode != 'a':
+            self._writer.writerow(['ligne', 'raison', 'contenu'])
+
+    def reject(self, row_number, reason, row):
+        self.counts[reason] += 1
+        self._pending.append((row_number, reason, row))
+
+    def _write_pending(self):
+        self._pending.sort(key=operator.itemgetter(0))
+        for row_number, reason, row in self._pending:
+            self._writer.writerow([row_number, reason, self._row_formatter.writerow(row).rstrip('\r\n')])
+        self._pending = []
+
+    def parse_block(self, block, indexes, first_row):
+        """
+        Return the rows of `block` whose coordinates are valid and their coordinate arrays [x, y, z]
+        The whole block is converted at once, rows are only checked one by one if this conversion fails.
+        """
+        self._write_pending()
+        row_numbers = np.arange(first_row, first_row + len(block))
+        try:
+            arrays = [None if index is None else np.array([row[index] for row in block], dtype=np.float64)
+                      for index in indexes]
+        except (ValueError, IndexError):
+            valid = np.ones(len(block), dtype=bool)
+            for i, row in enumerate(block):
+                for name, index in zip('xyz', indexes):
+                    if index is None:
+                        continue
                     try:
-                        row[item]
+                        float(row[index])
+                    except IndexError:
+                        self.reject(row_numbers[i], "colonnes manquantes", row)
                     except ValueError:
-                        sys.exit("La colonne {} n'existe pas".format(item))
-                    try:
-                        return float(row[item])
-                    except:
-                        sys.exit("La valeur {} n'est pas un flottant".format(row[item]))
-
-                # Iterate over each line
-                for i, row in enumerate(csv_reader):
-                    x = float(row[args.x])
-                    y = float(row[args.y])
-                    if args.z:
-                        z = float(row[args.z])
-                        pt = Point(x, y, z)
+                        self.reject(row_numbers[i], "valeur non numérique ({})".format(name), row)
                     else:
-                        pt = Point(x, y)
+                        continue
+                    valid[i] = False
+                    break
+            block = list(itertools.compress(block, valid))
+            row_numbers = row_numbers[valid]
+            arrays = [None if index is None else np.array([row[index] for row in block], dtype=np.float64)
+                      for index in indexes]
+        self.block_rows = row_numbers
+        return block, arrays
+
+    def filter_non_finite(self, block, coordinates):
+        """Reject rows of the last parsed block whose transformed coordinates (x, y, z) are not finite"""
+        finite = np.logical_and.reduce([np.isfinite(values) for values in coordinates if values is not None])
+        if finite.all():
+            return block, coordinates
+        for i in np.flatnonzero(~finite):
+            self.reject(self.block_rows[i], "résultat non fini", block[i])
+        self.block_rows = self.block_rows[finite]
+        return list(itertools.compress(block, finite)), tuple(None if values is None else values[finite]
+                                                              for values in coordinates)
+
+    def close(self):
+        self._write_pending()
+        self._file.close()
+
+    def log_summary(self, logger):
+        nb_rejects = sum(self.counts.values())
+        if nb_rejects == 0:
+            logger.info("Aucune ligne rejetée")
+            return
+        logger.warning("{} lignes rejetées, écrites dans {} :".format(nb_rejects, self.path))
+        for reason, nb_rows in self.counts.most_common():
+            logger.warning("    - {} : {}".format(reason, nb_rows))
+
+
+def iter_blocks(iterable, chunk_size):
+    """Yield successive lists of at most `chunk_size` items from `iterable`"""
+    iterator = iter(iterable)
+    while True:
+        block = list(itertools.islice(iterator, chunk_size))
+        if not block:
+            return
+        yield block
+
+
+def get_column_index(fieldnames, column, inname):
+    try:
+        return fieldnames.index(column)
+    except ValueError:
+        sys.exit("La colonne '{}' n'est pas dans le fichier '{}'".format(column, inname))
+
+
+def column_to_array(block, index, first_row):
+    """Convert column `index` of a block of rows (lists of strings) into a float64 array"""
+    try:
+        return np.array([row[index] for row in block], dtype=np.float64)
+    except (ValueError, IndexError):
+        # Find the faulty row to report it
+        for i, row in enumerate(block):
+            try:
+                float(row[index])
+            except IndexError:
+                sys.exit("La ligne {} n'a pas assez de colonnes".format(first_row + i))
+            except ValueError:
+                sys.exit("La valeur {} (ligne {}) n'est pas un flottant".format(row[index], first_row + i))
+        raise
+
+
+def read_csv_header(csv_reader, args):
+    """Return fieldnames and indexes of x, y and z columns (index of z is None if there is no z)"""
+    try:
+        fieldnames = next(csv_reader)
+    except StopIteration:
+        sys.exit("Le fichier '{}' est vide".format(args.inname_csv))
+
+    # Check x, y (and z) column existancy
+    index_x = get_column_index(fieldnames, args.x, args.inname_csv)
+    index_y = get_column_index(fieldnames, args.y, args.inname_csv)
+    index_z = get_column_index(fieldnames, args.z, args.inname_csv) if args.z else None
+    return fieldnames, (index_x, index_y, index_z)
+
+
+def iter_csv_points(csv_reader, indexes, chunk_size, rejects=None):
+    """
+    Yield blocks of at most `chunk_size` rows with their coordinate arrays and the number of rows read:
+    (block, x, y, z, nb_rows)
+    The first faulty row stops the run, unless `rejects` (RowRejects) is given: faulty rows are then removed from blocks
+    (which may become empty).
+    Blank lines (empty rows) are skipped, as csv.DictReader does.
+    """
+    index_x, index_y, index_z = indexes
+    nb_points = 0
+    for block in iter_blocks(filter(None, csv_reader), chunk_size):
+        if rejects is not None:
+            nb_rows = len(block)
+            block, (x, y, z) = rejects.parse_block(block, indexes, rejects.first_row + nb_points)
+            nb_points += nb_rows
+            yield block, x, y, z, nb_rows
+            continue
+        x = column_to_array(block, index_x, nb_points + 1)
+        y = column_to_array(block, index_y, nb_points + 1)
+        z = column_to_array(block, index_z, nb_points + 1) if index_z is not None else None
+        yield block, x, y, z, len(block)
+        nb_points += len(block)
+
+
+def format_block_coordinates(block, indexes, coordinates, fmt_str):
+    """Replace coordinates of the rows of `block` by formatted `coordinates` (x, y, z)"""
+    index_x, index_y, index_z = indexes
+    x, y, z = coordinates
+    for row, x_str, y_str in zip(block, map(fmt_str.format, x), map(fmt_str.format, y)):
+        row[index_x] = x_str
+        row[index_y] = y_str
+    if z is not None:
+        for row, z_str in zip(block, map(fmt_str.format, z)):
+            row[index_z] = z_str
+
+
+def write_transformed_block(csv_writer, block, indexes, coordinates, fmt_str, stats):
+    """Replace coordinates of the rows of `block` by formatted `coordinates` (x, y, z) and write them"""
+    with stats.timer('format'):
+        format_block_coordinates(block, indexes, coordinates, fmt_str)
+    with stats.timer('write'):
+        csv_writer.writerows(block)
+
+
+def ends_in_quoted_field(line, sep, in_quotes=False, quotechar='"'):
+    """
+    Return whether a raw CSV line ends inside a quoted field (the record then goes on with the next line)
+    `in_quotes` tells if the line starts inside a quoted field. As with the csv module, a quote character opens a
+    quoted field only at the beginning of a field, elsewhere it is a literal character.
+
+    >>> ends_in_quoted_field('1;0;0;pipe 5" steel\\n', ';')
+    False
+    >>> ends_in_quoted_field('1;0;0;"multi\\n', ';')
+    True
+    >>> ends_in_quoted_field('line" ; "end\\n', ';', in_quotes=True)
+    False
+    """
+    position = 0
+    end = len(line)
+    while position < end:
+        if in_quotes:
+            position = line.find(quotechar, position)
+            if position < 0:
+                return True
+            if line.startswith(quotechar, position + 1):
+                # Doubled quote character inside the quoted field
+                position += 2
+                continue
+            in_quotes = False
+            position += 1
+        elif line.startswith(quotechar, position):
+            # Quote character at the beginning of a field
+            in_quotes = True
+            position += 1
+            continue
+        # Go to the beginning of the next field
+        position = line.find(sep, position)
+        if position < 0:
+            return False
+        position += len(sep)
+    return in_quotes
+
+
+def iter_raw_records(lines, sep, quotechar='"'):
+    """
+    Yield raw CSV records from lines, a record spans several lines if a quoted field contains line breaks
+    Records are split like csv.reader does:
+
+    >>> lines = ['id;x;y;name\\n', '1;0;0;pipe 5" steel\\n', '2;1;1;a\\n', '3;2;2;"b\\n', 'c";x\\n', '4;3;3;6" d\\n']
+    >>> len(list(iter_raw_records(lines, ';'))) == len(list(csv.reader(lines, delimiter=';')))
+    True
+    """
+    pending = None
+    for line in lines:
+        if pending is not None:
+            pending += line
+            if not ends_in_quoted_field(line, sep, True, quotechar):
+                yield pending
+                pending = None
+        elif quotechar in line and ends_in_quoted_field(line, sep, False, quotechar):
+            pending = line
+        else:
+            yield line
+    if pending is not None:
+        yield pending
+
+
+def get_field_spans(record, sep, indexes, quotechar='"'):
+    """
+    Return the (start, end) positions in a raw CSV record (without line terminator) of the fields `indexes`,
+    in the same order
+    The record is only scanned up to the last requested field. The list stops at the first missing field.
+    """
+    record_end = len(record)
+    spans = {}
+    start = 0
+    for index in range(max(indexes) + 1):
+        if start > record_end:
+            break
+        position = start
+        if record.startswith(quotechar, start):
+            # Skip the quoted part (with doubled quote characters)
+            position += 1
+            while True:
+                position = record.find(quotechar, position)
+                if position < 0:
+                    position = record_end
+                    break
+                position += 1
+                if not record.startswith(quotechar, position):
+                    break
+                position += 1
+        end = record.find(sep, position, record_end)
+        if end < 0:
+            end = record_end
+        spans[index] = (start, end)
+        start = end + len(sep)
+    return [spans[index] for index in itertools.takewhile(spans.__contains__, indexes)]
+
+
+def unquote_field(field, quotechar='"'):
+    if field.startswith(quotechar):
+        return field[1:-1].replace(quotechar*2, quotechar)
+    return field
+
+
+def split_raw_record(record, sep, indexes, quotechar='"'):
+    """
+    Split a raw CSV record around the fields `indexes`: returns (parts, slots, joiner, terminator)
+    such that `parts[slots[i]]` is the (unquoted) value of field `indexes[i]` and, once these slots are replaced,
+    `joiner.join(parts) + terminator` is the record (`slots` stops at the first missing field)
+    Records without quote character are simply split on the separator (up to the last field needed), others are
+    scanned with get_field_spans.
+    """
+    body = record.rstrip('\r\n')
+    terminator = record[len(body):]
+    if quotechar not in body:
+        parts = body.split(sep, max(indexes) + 1)
+        slots = indexes if max(indexes) < len(parts) else [index for index in indexes if index < len(parts)]
+        return parts, slots, sep, terminator
+    spans = get_field_spans(body, sep, indexes, quotechar)
+    parts = []
+    slots = [None]*len(spans)
+    position = 0
+    for i in sorted(range(len(spans)), key=spans.__getitem__):
+        start, end = spans[i]
+        parts.append(body[position:start])
+        slots[i] = len(parts)
+        parts.append(unquote_field(body[start:end], quotechar))
+        position = end
+    parts.append(body[position:])
+    return parts, slots, '', terminator
+
+
+def transform_csv_passthrough(in_csv, out_csv, transformation, args, logger, write_header=True, stats=None):
+    """
+    Transform coordinates of an opened CSV stream, copying everything else byte for byte into `out_csv`
+    Each raw record is scanned up to the last coordinate field only: the x, y (and z) fields are replaced by the
+    transformed values and the other fields, the quoting and the line terminators are kept as they are.
+    Returns the number of points
+    """
+    if stats is None:
+        stats = TransformStats()
+    if set(args.sep) & set("0123456789.-+einfa"):
+        sys.exit("Le séparateur '{}' ne permet pas de recopier les lignes telles quelles".format(args.sep))
+    records = iter_raw_records(in_csv, args.sep)
+    header = next(records, None)
+    fieldnames, indexes = read_csv_header(csv.reader([] if header is None else [header], delimiter=args.sep), args)
+    indexes = [index for index in indexes if index is not None]
+    if write_header:
+        out_csv.write(header)
+
+    fmt_str = "{:."+str(args.digits)+"f}"
+    nb_points = 0
+    for block in iter_blocks(records, args.chunk_size):
+        with stats.timer('parse'):
+            # Blank lines are copied as they are
+            raw_block = block
+            block = [split_raw_record(record, args.sep, indexes) for record in raw_block if record.rstrip('\r\n')]
+            values = [[parts[slot] for slot in slots] for parts, slots, _, _ in block]
+            coordinates = [column_to_array(values, i, nb_points + 1) for i in range(len(indexes))]
+        stats.count('rows_parsed', len(block))
+
+        with stats.timer('transform'):
+            coordinates = transformation.apply(*coordinates)
+        stats.count('rows_transformed', len(block))
+
+        with stats.timer('format'):
+            columns = [map(fmt_str.format, coordinates[i]) for i in range(len(indexes))]
+            lines = []
+            for (parts, slots, joiner, terminator), strings in zip(block, zip(*columns)):
+                for slot, string in zip(slots, strings):
+                    parts[slot] = string
+                lines.append(joiner.join(parts) + terminator)
+            if len(block) < len(raw_block):
+                rows = iter(lines)
+                lines = [next(rows) if record.rstrip('\r\n') else record for record in raw_block]
+        with stats.timer('write'):
+            out_csv.write(''.join(lines))
+        stats.count('rows_written', len(block))
+
+        nb_points += len(block)
+        stats.log_progress(logger)
+    return nb_points
+
+
+def transform_csv_stream(in_csv, out_csv, transformation, args, logger, write_header=True, stats=None, rejects=None):
+    """
+    Transform coordinates of an opened CSV stream and write the result into `out_csv`
+    `in_csv` can be any iterable of lines starting with the header line
+    Rows are read by blocks of `args.chunk_size` rows so that memory usage does not depend on the file size
+    With `args.passthrough`, the other fields are copied unchanged (see transform_csv_passthrough).
+    Faulty rows are written into `rejects` (RowRejects) if given, instead of stopping the run.
+    Returns the number of points
+    """
+    if args.passthrough:
+        return transform_csv_passthrough(in_csv, out_csv, transformation, args, logger, write_header, stats)
+    return transform_csv_fanout(in_csv, [(out_csv, transformation)], args, logger, write_header, stats, rejects)
+
+
+def transform_csv_fanout(in_csv, outputs, args, logger, write_header=True, stats=None, rejects=None):
+    """
+    Transform coordinates of an opened CSV stream into several reference frames at once
+    `outputs` is a list of (out_csv, transformation): the input is parsed only once, then each block is transformed
+    and written for every output, in one thread per output when there are several of them.
+    Faulty rows are written into `rejects` (RowRejects, with a single output only) if given.
+    Returns the number of points written (per output)
+    """
+    if stats is None:
+        stats = TransformStats()
+    csv_reader = csv.reader(in_csv, delimiter=args.sep)
+    fieldnames, indexes = read_csv_header(csv_reader, args)
+
+    csv_writers = [csv.writer(out_csv, delimiter=args.sep) for out_csv, _ in outputs]
+    if write_header:
+        for csv_writer in csv_writers:
+            csv_writer.writerow(fieldnames)
+
+    fmt_str = "{:."+str(args.digits)+"f}"
+    executor = None
+    if len(outputs) > 1:
+        import concurrent.futures  # only needed with several outputs
+        executor = concurrent.futures.ThreadPoolExecutor(len(outputs))
+        # Timers of concurrent threads are kept apart and merged at the end
+        output_stats = [TransformStats(log_interval=0) for _ in outputs]
+
+    def process_output(i, block, x, y, z, output_stats):
+        with output_stats.timer('transform'):
+            coordinates = outputs[i][1].apply(x, y, z)
+            if rejects is not None:
+                block, coordinates = rejects.filter_non_finite(block, coordinates)
+        if executor is not None:
+            block = [row.copy() for row in block]  # rows are shared by all outputs
+        write_transformed_block(csv_writers[i], block, indexes, coordinates, fmt_str, output_stats)
+        return len(block)
+
+    nb_points = 0
+    blocks = iter_csv_points(csv_reader, indexes, args.chunk_size, rejects)
+    try:
+        while True:
+            with stats.timer('parse'):
+                item = next(blocks, None)
+            if item is None:
+                break
+            block, x, y, z, nb_rows = item
+            stats.count('rows_parsed', nb_rows)
+
+            if executor is None:
+                nb_written = process_output(0, block, x, y, z, stats)
+            else:
+                futures = [executor.submit(process_output, i, block, x, y, z, output_stats[i])
+                           for i in range(len(outputs))]
+                nb_written = sum(future.result() for future in futures)//len(outputs)
+            stats.count('rows_transformed', len(block)*len(outputs))
+            stats.count('rows_written', nb_written*len(outputs))
+
+            nb_points += nb_written
+            stats.log_progress(logger)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+            for s in output_stats:
+                stats.merge(s)
+    return nb_points
+
+
+def morton_keys(ix, iy):
+    """Return Morton (Z-order) keys of integer grid coordinates (arrays of uint64 lower than 2**32)"""
+    def spread_bits(v):
+        v = v & 0xFFFFFFFF
+        v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+        v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+        v = (v | (v << 2)) & 0x3333333333333333
+        v = (v | (v << 1)) & 0x5555555555555555
+        return v
+    return spread_bits(ix.astype(np.uint64)) | (spread_bits(iy.astype(np.uint64)) << np.uint64(1))
+
+
+def hilbert_keys(ix, iy, bits):
+    """Return Hilbert curve keys of integer grid coordinates (arrays lower than 2**bits)"""
+    x = ix.astype(np.int64)
+    y = iy.astype(np.int64)
+    keys = np.zeros(len(x), dtype=np.uint64)
+    n = 1 << bits
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += np.uint64(s*s)*((3*rx) ^ ry).astype(np.uint64)
+        # Rotate the quadrant
+        flip = rx & ~ry
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s >>= 1
+    return keys
+
+
+def get_curve_keys(x, y, bbox, curve, bits=SORT_BITS):
+    """Return keys along a space-filling curve ('morton' or 'hilbert') of points in bounding box (xmin, ymin, xmax, ymax)"""
+    xmin, ymin, xmax, ymax = bbox
+    cells = (1 << bits) - 1
+    ix = np.clip((x - xmin)/max(xmax - xmin, 1e-300)*cells, 0, cells).astype(np.uint64)
+    iy = np.clip((y - ymin)/max(ymax - ymin, 1e-300)*cells, 0, cells).astype(np.uint64)
+    return morton_keys(ix, iy) if curve == 'morton' else hilbert_keys(ix, iy, bits)
+
+
+class RowFormatter:
+    """File-like object for csv.writer returning the formatted row instead of writing it"""
+    @staticmethod
+    def write(line):
+        return line
+
+
+def transform_csv_sorted(in_csv, out_csv, transformation, args, logger, stats=None, rejects=None):
+    """
+    Transform coordinates of an opened CSV stream and write rows sorted along a space-filling curve (`args.sort`)
+    in the target reference frame, with an external-memory sort so that memory usage only depends on `args.chunk_size`:
+    1. every block is transformed and formatted, then stored with its coordinates in a temporary file (a run);
+    2. once the bounding box is known, each run is sorted by curve key;
+    3. sorted runs are merged into `out_csv` (equal keys keep the input order).
+    With `args.tile_index` (subdivision level), the byte range of each tile of the curve is written into
+    `<output>.tiles.csv`.
+    Faulty rows are written into `rejects` (RowRejects) if given, instead of stopping the run.
+    Returns the number of points
+    """
+    import heapq
+    import tempfile  # only needed in this mode
+    if stats is None:
+        stats = TransformStats()
+    csv_reader = csv.reader(in_csv, delimiter=args.sep)
+    fieldnames, indexes = read_csv_header(csv_reader, args)
+    row_formatter = csv.writer(RowFormatter(), delimiter=args.sep)
+    fmt_str = "{:."+str(args.digits)+"f}"
+    bbox = [math.inf, math.inf, -math.inf, -math.inf]
+
+    with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(args.outname_csv))) as runs_file, \
+            tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(args.outname_csv))) as sorted_file:
+        # 1. Transformed runs
+        nb_runs = 0
+        blocks = iter_csv_points(csv_reader, indexes, args.chunk_size, rejects)
+        while True:
+            with stats.timer('parse'):
+                item = next(blocks, None)
+            if item is None:
+                break
+            block, x, y, z, nb_rows = item
+            stats.count('rows_parsed', nb_rows)
+            with stats.timer('transform'):
+                x, y, z = transformation.apply(x, y, z)
+                if rejects is not None:
+                    block, (x, y, z) = rejects.filter_non_finite(block, (x, y, z))
+                    if not block:
+                        continue
+                bbox = [min(bbox[0], x.min()), min(bbox[1], y.min()), max(bbox[2], x.max()), max(bbox[3], y.max())]
+            stats.count('rows_transformed', len(block))
+            with stats.timer('format'):
+                format_block_coordinates(block, indexes, (x, y, z), fmt_str)
+                lines = [row_formatter.writerow(row) for row in block]
+            with stats.timer('write'):
+                pickle.dump((x, y, lines), runs_file, pickle.HIGHEST_PROTOCOL)
+            nb_runs += 1
+            stats.log_progress(logger)
+
+        # 2. Sorted runs, stored by parts so that the merge only holds a part of each run
+        part_size = max(1, args.chunk_size//max(nb_runs, 1))
+        run_parts = []  # positions of the parts of each sorted run
+        runs_file.seek(0)
+        for _ in range(nb_runs):
+            with stats.timer('write'):
+                x, y, lines = pickle.load(runs_file)
+            with stats.timer('sort'):
+                keys = get_curve_keys(x, y, bbox, args.sort)
+                order = np.argsort(keys, kind='stable')
+            with stats.timer('write'):
+                positions = []
+                for start in range(0, len(order), part_size):
+                    part = order[start:start + part_size]
+                    positions.append(sorted_file.tell())
+                    pickle.dump((keys[part].tolist(), x[part].tolist(), y[part].tolist(), [lines[i] for i in part]),
+                                sorted_file, pickle.HIGHEST_PROTOCOL)
+                run_parts.append(positions)
+
+        def iter_sorted_run(positions):
+            for position in positions:
+                sorted_file.seek(position)
+                yield from zip(*pickle.load(sorted_file))
+
+        # 3. Merge
+        tile_shift = 2*(SORT_BITS - args.tile_index) if args.tile_index is not None else None
+        tiles = []  # [tile, number of points, start byte, end byte, xmin, ymin, xmax, ymax]
+        encoding = getattr(out_csv, 'encoding', None) or locale.getpreferredencoding(False)
+        header = row_formatter.writerow(fieldnames)
+        out_csv.write(header)
+        position = len(header.encode(encoding))
+        nb_points = 0
+        with stats.timer('write'):
+            for key, x, y, line in heapq.merge(*map(iter_sorted_run, run_parts), key=operator.itemgetter(0)):
+                out_csv.write(line)
+                nb_points += 1
+                if tile_shift is not None:
+                    tile = key >> tile_shift
+                    if not tiles or tiles[-1][0] != tile:
+                        tiles.append([tile, 0, position, position, x, y, x, y])
+                    position += len(line.encode(encoding))
+                    current = tiles[-1]
+                    current[1] += 1
+                    current[3] = position
+                    current[4:] = min(current[4], x), min(current[5], y), max(current[6], x), max(current[7], y)
+        stats.count('rows_written', nb_points)
+
+    if tile_shift is not None:
+        index_name = args.outname_csv + TILE_INDEX_SUFFIX
+        with open(index_name, 'w' if args.force else 'x', newline='') as index_csv:
+            index_writer = csv.writer(index_csv, delimiter=args.sep)
+            index_writer.writerow(['tile', 'nb_points', 'start_byte', 'end_byte', 'xmin', 'ymin', 'xmax', 'ymax'])
+            index_writer.writerows([tile[:4] + [fmt_str.format(value) for value in tile[4:]] for tile in tiles])
+        logger.info("Index de {} tuiles écrit dans {}".format(len(tiles), index_name))
+    return nb_points
+
+
+def split_csv_byte_ranges(inname, nb_parts):
+    """
+    Split the body of a CSV file (after the header line) into at most `nb_parts` byte ranges aligned on line starts
+    Returns the header line (bytes) and the list of ranges (start, end)
+    Quoted fields containing line breaks are not supported.
+    """
+    with open(inname, 'rb') as in_csv:
+        header = in_csv.readline()
+        start = in_csv.tell()
+        end = os.fstat(in_csv.fileno()).st_size
+        bounds = [start]
+        for i in range(1, nb_parts):
+            # Move to the beginning of the line containing this position (or the next one)
+            in_csv.seek(start + (end - start)*i//nb_parts - 1)
+            in_csv.readline()
+            position = in_csv.tell()
+            if bounds[-1] < position < end:
+                bounds.append(position)
+        bounds.append(end)
+    return header, list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_lines_in_range(inname, start, end, encoding):
+    """Yield decoded lines of file `inname` between byte positions `start` and `end`"""
+    with open(inname, 'rb') as in_csv:
+        in_csv.seek(start)
+        position = start
+        for line in in_csv:
+            if position >= end:
+                break
+            position += len(line)
+            yield line.decode(encoding)
+
+
+def transform_csv_range(part_name, header, start, end, transformation, args, write_header):
+    """Transform a byte range of the input CSV file into `part_name` and return the TransformStats of this range"""
+    encoding = locale.getpreferredencoding(False)
+    lines = itertools.chain([header.decode(encoding)], iter_lines_in_range(args.inname_csv, start, end, encoding))
+    stats = TransformStats()
+    with open(part_name, 'w', encoding=encoding, newline='') as out_csv:
+        try:
+            transform_csv_stream(lines, out_csv, transformation, args, logging.getLogger(__name__), write_header, stats)
+        except SystemExit as e:
+            # Rows are numbered from the beginning of the range
+            sys.exit("{} (lignes numérotées depuis l'octet {} du fichier ; les champs entre guillemets contenant des "
+                     "retours à la ligne ne sont pas pris en charge avec --jobs)".format(e.code, start))
+    return stats
+
+
+def transform_csv_parallel(out_csv, transformation, args, logger, stats=None):
+    """
+    Transform the input CSV file with `args.jobs` processes
+    The file is split on newline-aligned byte ranges, each range is transformed into a temporary file
+    and the temporary files are concatenated in the original order into `out_csv` (opened in binary mode)
+    Timings of all processes are added into `stats`.
+    Returns the number of points
+    """
+    if stats is None:
+        stats = TransformStats()
+    import concurrent.futures  # only needed in this mode
+
+    header, ranges = split_csv_byte_ranges(args.inname_csv, args.jobs)
+    if not header:
+        sys.exit("Le fichier '{}' est vide".format(args.inname_csv))
+    logger.info("Découpage du fichier en {} blocs traités par {} processus".format(len(ranges), args.jobs))
+
+    part_names = ["{}.part.{}".format(args.outname_csv, i) for i in range(len(ranges))]
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [executor.submit(transform_csv_range, part_name, header, start, end, transformation, args, i == 0)
+                       for i, (part_name, (start, end)) in enumerate(zip(part_names, ranges))]
+            nb_points = 0
+            for future in futures:
+                range_stats = future.result()
+                nb_points += range_stats.counters['rows_written']
+                stats.merge(range_stats)
+
+        with stats.timer('write'):
+            for part_name in part_names:
+                with open(part_name, 'rb') as part:
+                    shutil.copyfileobj(part, out_csv)
+    finally:
+        for part_name in part_names:
+            if os.path.exists(part_name):
+                os.remove(part_name)
+    return nb_points
+
 
-                    for r1, r2 in zip(path[:-1], path[1:]):
-                        for transformation in ref_frame_graph.adj[r1][r2]['function']:
-                            transformation(pt)
+def find_last_line_end(in_csv, start, end, block_size=65536):
+    """Return the position just after the last newline between byte positions `start` and `end` (`start` if none)"""
+    position = end
+    while position > start:
+        block_start = max(start, position - block_size)
+        in_csv.seek(block_start)
+        block = in_csv.read(position - block_start)
+        index = block.rfind(b'\n')
+        if index >= 0:
+            return block_start + index + 1
+        position = block_start
+    return start
 
-                    fmt_str = "{:."+str(args.digits)+"f}"
-                    row[args.x] = fmt_str.format(pt.x)
-                    row[args.y] = fmt_str.format(pt.y)
-                    if args.z:
-                        row[args.z] = fmt_str.format(pt.z)
 
-                    if i % LOG_POINT_FREQUENCY == 0:
-                        logger.debug("{}: {}, {}".format(i, row[args.x], row[args.y]))
-                    csv_writer.writerow(row)
+def get_tail_hash(inname, end, size=CHECKPOINT_TAIL_SIZE):
+    """Return the hash of the bytes of file `inname` just before position `end` (detects a rewritten input file)"""
+    with open(inname, 'rb') as filein:
+        filein.seek(max(0, end - size))
+        return hashlib.sha256(filein.read(min(end, size))).hexdigest()
 
-                logger.info("Fin du fichier, {} points traités".format(i+1))
 
+def read_checkpoint(path):
+    try:
+        with open(path) as filein:
+            return json.load(filein)
+    except (OSError, ValueError):
+        return None
+
+
+def transform_csv_incremental(transformation, args, logger, stats=None):
+    """
+    Transform only rows appended to the input CSV file since the last run and append them to the output file
+    A checkpoint (byte offset and number of rows already read, hash of the configuration, reference frames, header and
+    output options) is stored next to the output file: everything is recomputed if one of them has changed.
+    Only complete lines are read, a last line still being written is left for the next run
+    (quoted fields containing line breaks are not supported).
+    Returns the number of points added
+    """
+    if stats is None:
+        stats = TransformStats()
+    encoding = locale.getpreferredencoding(False)
+    checkpoint_name = args.outname_csv + CHECKPOINT_SUFFIX
+
+    with open(args.inname_csv, 'rb') as in_csv:
+        header = in_csv.readline()
+        if not header.endswith(b'\n'):
+            sys.exit("Le fichier '{}' est vide".format(args.inname_csv))
+        body_start = in_csv.tell()
+        end = find_last_line_end(in_csv, body_start, os.fstat(in_csv.fileno()).st_size)
+    with open(args.config_xml, 'rb') as filein:
+        config_hash = hashlib.sha256(filein.read()).hexdigest()
+    state = {
+        'config_hash': config_hash,
+        'source': args.source,
+        'target': args.target,
+        'header': header.decode(encoding),
+        # Every option changing the bytes written (quoting of passthrough, rows dropped into the reject file)
+        'options': [args.sep, args.x, args.y, args.z, args.digits, args.passthrough, args.rejects],
+    }
+
+    checkpoint = read_checkpoint(checkpoint_name)
+    resume = False
+    if checkpoint is None:
+        logger.info("Pas de point de reprise, traitement complet")
+    elif any(checkpoint.get(key) != value for key, value in state.items()):
+        logger.info("Configuration, repères, en-tête ou options modifiés depuis le dernier traitement, "
+                    "traitement complet")
+    elif not body_start <= checkpoint['offset'] <= end or \
+            get_tail_hash(args.inname_csv, checkpoint['offset']) != checkpoint['tail_hash']:
+        logger.info("Le fichier d'entrée a été réécrit, traitement complet")
+    elif not os.path.exists(args.outname_csv) or os.path.getsize(args.outname_csv) < checkpoint['output_size']:
+        logger.info("Le fichier de sortie a été modifié, traitement complet")
     else:
-        # Multiple paths
-        sys.exit("""Liste des chemins possibles : {}
-    ERREUR: Plusieurs suites de transformations possibles pour {}->{}""".format(all_path, args.source, args.target))
+        resume = True
+
+    if resume:
+        start, nb_rows = checkpoint['offset'], checkpoint['rows']
+        # Drop rows written by an interrupted run after the checkpoint
+        os.truncate(args.outname_csv, checkpoint['output_size'])
+        mode = 'a'
+        logger.info("Reprise après {} lignes déjà traitées".format(nb_rows))
+    else:
+        start, nb_rows = body_start, 0
+        # The output of a previous run can be overwritten
+        mode = 'w' if args.force or checkpoint is not None else 'x'
+
+    rejects = None
+    if args.rejects:
+        rejects_name = args.outname_csv + REJECTS_SUFFIX
+        rejects = RowRejects(rejects_name, args.sep, 'a' if resume and os.path.exists(rejects_name) else 'w',
+                             nb_rows + 1)
+    lines = itertools.chain([header.decode(encoding)], iter_lines_in_range(args.inname_csv, start, end, encoding))
+    try:
+        with open(args.outname_csv, mode, encoding=encoding, newline='') as out_csv:
+            nb_points = transform_csv_stream(lines, out_csv, transformation, args, logger, not resume, stats, rejects)
+    finally:
+        if rejects is not None:
+            rejects.close()
+    nb_rejects = 0
+    if rejects is not None:
+        nb_rejects = sum(rejects.counts.values())
+        stats.count('rows_rejected', nb_rejects)
+        rejects.log_summary(logger)
+    state.update({
+        'offset': end,
+        'rows': nb_rows + nb_points + nb_rejects,
+        'tail_hash': get_tail_hash(args.inname_csv, end),
+        'output_size': os.path.getsize(args.outname_csv),
+    })
+    tmp_name = "{}.{}.tmp".format(checkpoint_name, os.getpid())
+    with open(tmp_name, 'w') as fileout:
+        json.dump(state, fileout, indent=2)
+    os.replace(tmp_name, checkpoint_name)
+    return nb_points
+
+
+class BackgroundReader(io.RawIOBase):
+    """
+    Binary stream reading another binary stream in a background thread
+    Used for compressed files, so that decompression overlaps with parsing and transformation.
+    """
+    def __init__(self, stream, block_size=DECOMPRESSION_BLOCK_SIZE, queue_size=4):
+        super().__init__()
+        self._stream = stream
+        self._block_size = block_size
+        self._queue = queue.Queue(queue_size)
+        self._buffer = b''
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read_blocks, daemon=True)
+        self._thread.start()
+
+    def _read_blocks(self):
+        try:
+            while not self._stop.is_set():
+                data = self._stream.read(self._block_size)
+                self._queue.put(data)
+                if not data:
+                    return
+        except Exception as e:
+            self._queue.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._buffer and not self._eof:
+            data = self._queue.get()
+            if isinstance(data, Exception):
+                raise data
+            self._eof = not data
+            self._buffer = data
+        nb_bytes = min(len(buffer), len(self._buffer))
+        buffer[:nb_bytes] = self._buffer[:nb_bytes]
+        self._buffer = self._buffer[nb_bytes:]
+        return nb_bytes
+
+    def close(self):
+        if not self.closed:
+            # Unblock and wait for the background thread before closing the underlying stream
+            self._stop.set()
+            while self._thread.is_alive():
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    self._thread.join(0.01)
+            self._stream.close()
+        super().close()
+
+
+def get_compression(path, read=False):
+    """
+    Return the module name of the compression of a file ('gzip', 'bz2' or 'lzma'), or None if not compressed
+    A file to read is detected from its first bytes, a file to write from its extension (see COMPRESSIONS).
+    """
+    if read:
+        try:
+            with open(path, 'rb') as filein:
+                start = filein.read(max(len(magic) for magic in COMPRESSION_MAGICS))
+        except OSError:
+            start = b''  # error reported when the file is really opened
+        for magic, compression in COMPRESSION_MAGICS.items():
+            if start.startswith(magic):
+                return compression
+        return None
+    return COMPRESSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def strip_compression_extension(path):
+    root, ext = os.path.splitext(path)
+    return root if ext.lower() in COMPRESSIONS else path
+
+
+def open_points_file(path, mode='r', encoding=None):
+    """
+    Open a CSV file like `open` (with newline=''), compressed or not (see get_compression)
+    Compressed files are decompressed in a background thread.
+    """
+    compression = get_compression(path, read='r' in mode)
+    if compression is None:
+        return open(path, mode, encoding=encoding, newline=None if 'b' in mode else '')
+    stream = importlib.import_module(compression).open(path, mode.replace('b', '') + 'b')
+    if 'r' in mode:
+        stream = io.BufferedReader(BackgroundReader(stream))
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding, newline='')
+
+
+def is_binary_path(path):
+    return os.path.splitext(path)[1].lower() in BINARY_EXTENSIONS
+
+
+def open_binary_points(path, nb_columns, mode='r'):
+    """
+    Return the array of points (n rows, columns x, y, [z]) stored in a binary file
+    .npy and raw (.bin with `nb_columns` columns) files are memory-mapped, .npz files (arrays x, y, [z], plus
+    `origin` for compact files) are loaded
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.npy':
+            points = np.load(path, mmap_mode=mode)
+        elif ext == '.npz':
+            with np.load(path) as archive:
+                points = np.column_stack([archive[name] for name in ('x', 'y', 'z') if name in archive])
+                if 'origin' in archive:
+                    # Compact file (see transform_compact)
+                    points = points.astype(np.float64) + archive['origin']
+        elif os.path.getsize(path) == 0:
+            points = np.empty((0, nb_columns))
+        else:
+            points = np.memmap(path, dtype='<f8', mode=mode).reshape(-1, nb_columns)
+    except (OSError, ValueError) as e:
+        sys.exit("Le fichier binaire '{}' n'est pas lisible : {}".format(path, e))
+    if points.ndim != 2 or points.shape[1] not in (2, 3):
+        sys.exit("Le fichier binaire '{}' doit contenir un tableau de points à 2 ou 3 colonnes (x, y, [z])".format(path))
+    return points
 
+
+def create_binary_points(path, shape, force):
+    """Return a writable array of points for a new binary file, to be written by `close_binary_points`"""
+    if not force and os.path.exists(path):
+        sys.exit("Le fichier '{}' existe déjà".format(path))
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npz' or shape[0] == 0:
+        return np.empty(shape, dtype='<f8')
+    elif ext == '.npy':
+        return np.lib.format.open_memmap(path, mode='w+', dtype='<f8', shape=shape)
+    else:
+        return np.memmap(path, dtype='<f8', mode='w+', shape=shape)
+
+
+def close_binary_points(path, points):
+    """Flush memory-mapped points or write in-memory points into `path`"""
+    ext = os.path.splitext(path)[1].lower()
+    if isinstance(points, np.memmap):
+        points.flush()
+    elif ext == '.npz':
+        np.savez(path, **{name: points[:, i] for i, name in enumerate(('x', 'y', 'z')[:points.shape[1]])})
+    elif ext == '.npy':
+        np.save(path, points)
+    else:
+        points.tofile(path)
+
+
+def transform_binary(transformation, args, logger, stats=None, rejects=None):
+    """
+    Transform coordinates when the input and/or the output file is binary (.npy, .npz or raw .bin)
+    Binary files only contain coordinates x, y and [z]: raw files have z if the z column is given.
+    Faulty rows of a CSV input are written into `rejects` (RowRejects) if given, instead of stopping the run.
+    Points are processed by blocks of `args.chunk_size` rows directly on memory-mapped arrays.
+    Returns the number of points
+    """
+    if stats is None:
+        stats = TransformStats()
+    nb_columns = 3 if args.z else 2
+    in_binary = is_binary_path(args.inname_csv)
+    out_binary = is_binary_path(args.outname_csv)
+
+    if in_binary and out_binary:
+        in_place = os.path.exists(args.outname_csv) and os.path.samefile(args.inname_csv, args.outname_csv) and \
+            os.path.splitext(args.outname_csv)[1].lower() != '.npz'
+        if in_place and not args.force:
+            sys.exit("Le fichier '{}' existe déjà".format(args.outname_csv))
+        with stats.timer('parse'):
+            points = open_binary_points(args.inname_csv, nb_columns, 'r+' if in_place else 'r')
+        out_points = points if in_place else create_binary_points(args.outname_csv, points.shape, args.force)
+        for start in range(0, len(points), args.chunk_size):
+            end = start + args.chunk_size
+            with stats.timer('transform'):
+                transformation.apply_to_points(points[start:end], out_points[start:end])
+            stats.count('rows_parsed', len(points[start:end]))
+            stats.count('rows_transformed', len(points[start:end]))
+            stats.log_progress(logger)
+        with stats.timer('write'):
+            close_binary_points(args.outname_csv, out_points)
+        stats.count('rows_written', len(points))
+        return len(points)
+
+    elif in_binary:
+        # Binary to CSV: only coordinates are written
+        with stats.timer('parse'):
+            points = open_binary_points(args.inname_csv, nb_columns)
+        fieldnames = [args.x, args.y, args.z or 'z'][:points.shape[1]]
+        fmt_str = "{:."+str(args.digits)+"f}"
+        with open_points_file(args.outname_csv, 'w' if args.force else 'x') as out_csv:
+            csv_writer = csv.writer(out_csv, delimiter=args.sep)
+            csv_writer.writerow(fieldnames)
+            for start in range(0, len(points), args.chunk_size):
+                with stats.timer('transform'):
+                    block = transformation.apply_to_points(points[start:start + args.chunk_size])
+                stats.count('rows_parsed', len(block))
+                stats.count('rows_transformed', len(block))
+                with stats.timer('format'):
+                    rows = list(zip(*(map(fmt_str.format, column) for column in block.T)))
+                with stats.timer('write'):
+                    csv_writer.writerows(rows)
+                stats.count('rows_written', len(block))
+                stats.log_progress(logger)
+        return len(points)
+
+    else:
+        # CSV to binary: coordinates are appended to a raw temporary file, then converted if necessary
+        if not args.force and os.path.exists(args.outname_csv):
+            sys.exit("Le fichier '{}' existe déjà".format(args.outname_csv))
+        raw_path = args.outname_csv + '.tmp'
+        nb_points = 0
+        try:
+            with open_points_file(args.inname_csv, 'r') as in_csv, open(raw_path, 'wb') as out_raw:
+                stats.watch_input(in_csv, args.inname_csv)
+                csv_reader = csv.reader(in_csv, delimiter=args.sep)
+                _, indexes = read_csv_header(csv_reader, args)
+                blocks = iter_csv_points(csv_reader, indexes, args.chunk_size, rejects)
+                while True:
+                    with stats.timer('parse'):
+                        item = next(blocks, None)
+                    if item is None:
+                        break
+                    block, x, y, z, nb_rows = item
+                    stats.count('rows_parsed', nb_rows)
+                    with stats.timer('transform'):
+                        x, y, z = transformation.apply(x, y, z)
+                    stats.count('rows_transformed', len(block))
+                    if rejects is not None:
+                        block, (x, y, z) = rejects.filter_non_finite(block, (x, y, z))
+                    with stats.timer('write'):
+                        np.column_stack([x, y] if z is None else [x, y, z]).astype('<f8').tofile(out_raw)
+                    stats.count('rows_written', len(block))
+                    nb_points += len(block)
+                    stats.log_progress(logger)
+
+            with stats.timer('write'):
+                if os.path.splitext(args.outname_csv)[1].lower() == '.bin':
+                    os.replace(raw_path, args.outname_csv)
+                else:
+                    raw_points = open_binary_points(raw_path, nb_columns)
+                    out_points = create_binary_points(args.outname_csv, raw_points.shape, True)
+                    for start in range(0, nb_points, args.chunk_size):
+                        end = start + args.chunk_size
+                        out_points[start:end] = raw_points[start:end]
+                    close_binary_points(args.outname_csv, out_points)
+                    del raw_points
+        finally:
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+        return nb_points
+
+
+def open_compact_points(path):
+    """Return (offsets, origin) of a compact .npz file, or None if the file is not compact"""
+    try:
+        with np.load(path) as archive:
+            if 'origin' not in archive:
+                return None
+            offsets = np.column_stack([archive[name] for name in ('x', 'y', 'z') if name in archive])
+            return offsets.astype(np.float32, copy=False), archive['origin']
+    except (OSError, ValueError) as e:
+        sys.exit("Le fichier binaire '{}' n'est pas lisible : {}".format(path, e))
+
+
+def transform_compact(transformation, args, logger, stats=None):
+    """
+    Transform a binary file into a compact .npz file: float32 offsets x, y, [z] from a float64 `origin`
+    The origin of a float64 input is the rounded center of its bounding box, then the transformation is applied with
+    AffineTransformation.apply_compact. The result is compared block by block with a float64 computation:
+    the maximum error is logged, and the output file is not written if it exceeds `args.compact`.
+    Returns the number of points
+    """
+    if stats is None:
+        stats = TransformStats()
+    if not is_binary_path(args.inname_csv) or os.path.splitext(args.outname_csv)[1].lower() != '.npz':
+        sys.exit("Le mode compact nécessite un fichier d'entrée binaire ({}) et un fichier de sortie .npz".format(
+            ', '.join(BINARY_EXTENSIONS)))
+    if not args.force and os.path.exists(args.outname_csv):
+        sys.exit("Le fichier '{}' existe déjà".format(args.outname_csv))
+
+    with stats.timer('parse'):
+        compact = open_compact_points(args.inname_csv) if args.inname_csv.lower().endswith('.npz') else None
+        if compact is None:
+            points = open_binary_points(args.inname_csv, 3 if args.z else 2)
+            origin = np.round((points.min(axis=0) + points.max(axis=0))/2) if len(points) > 0 \
+                else np.zeros(points.shape[1])
+            offsets = np.empty(points.shape, dtype=np.float32)
+        else:
+            offsets, origin = compact
+            points = None
+    logger.info("Origine locale : {}".format(origin.tolist()))
+
+    max_error = 0.
+    out_origin = np.array([value for value in transformation.apply(*origin) if value is not None])
+    for start in range(0, len(offsets), args.chunk_size):
+        end = start + args.chunk_size
+        with stats.timer('parse'):
+            if points is None:
+                exact = origin + offsets[start:end].astype(np.float64)
+            else:
+                exact = np.asarray(points[start:end], dtype=np.float64)
+                offsets[start:end] = exact - origin
+        stats.count('rows_parsed', len(exact))
+        with stats.timer('transform'):
+            transformation.apply_compact(offsets[start:end], origin, offsets[start:end])
+            error = np.abs(transformation.apply_to_points(exact) - (out_origin + offsets[start:end]))
+            if len(error) > 0:
+                max_error = max(max_error, float(np.max(error)))
+        stats.count('rows_transformed', len(exact))
+        stats.log_progress(logger)
+
+    logger.info("Erreur maximale du mode compact : {:.3g} (tolérance : {})".format(max_error, args.compact))
+    if not max_error <= args.compact:
+        sys.exit("L'erreur maximale du mode compact ({:.3g}) dépasse la tolérance {}, fichier '{}' non écrit".format(
+            max_error, args.compact, args.outname_csv))
+    with stats.timer('write'):
+        np.savez(args.outname_csv, origin=out_origin,
+                 **{name: offsets[:, i] for i, name in enumerate(('x', 'y', 'z')[:offsets.shape[1]])})
+    stats.count('rows_written', len(offsets))
+    return len(offsets)
+
+
+def is_vector_path(path):
+    return os.path.splitext(path)[1].lower() in VECTOR_DRIVERS
+
+
+def flatten_coordinates(coordinates, vertices):
+    """Append all vertices (tuples) of nested GeoJSON-like `coordinates` into the list `vertices`"""
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        vertices.append(coordinates)
+    else:
+        for item in coordinates:
+            flatten_coordinates(item, vertices)
+
+
+def rebuild_coordinates(coordinates, vertices):
+    """Return a copy of nested `coordinates` where vertices are taken successively from the iterator `vertices`"""
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return next(vertices)
+    return [rebuild_coordinates(item, vertices) for item in coordinates]
+
+
+def transform_vector_layer(transformation, args, logger, stats=None):
+    """
+    Transform all geometries of a vector layer (shapefile or GeoPackage, points, lines or polygons, 2D or 3D)
+    Vertices of a batch of `args.chunk_size` features are flattened into a single array and transformed at once,
+    then geometries are rebuilt and written by batch. Properties are copied, the output has no coordinate reference
+    system since it is defined in another reference frame.
+    Returns the number of vertices
+    """
+    import fiona  # optional dependency, only needed in this mode
+
+    if stats is None:
+        stats = TransformStats()
+    if not args.force and os.path.exists(args.outname_csv):
+        sys.exit("Le fichier '{}' existe déjà".format(args.outname_csv))
+    driver = VECTOR_DRIVERS[os.path.splitext(args.outname_csv)[1].lower()]
+
+    nb_vertices = 0
+    with fiona.open(args.inname_csv, 'r', layer=args.layer) as in_layer:
+        with fiona.open(args.outname_csv, 'w', driver=driver, schema=in_layer.schema,
+                        layer=in_layer.name if driver == 'GPKG' else None) as out_layer:
+            features = iter_blocks(in_layer, args.chunk_size)
+            while True:
+                with stats.timer('parse'):
+                    block = next(features, None)
+                    if block is None:
+                        break
+                    records = []
+                    vertices = []
+                    for feature in block:
+                        geometry = feature['geometry']
+                        if geometry is not None:
+                            if geometry['type'] == 'GeometryCollection':
+                                sys.exit("Les collections de géométries ne sont pas supportées")
+                            geometry = {'type': geometry['type'], 'coordinates': geometry['coordinates']}
+                            flatten_coordinates(geometry['coordinates'], vertices)
+                        records.append({'geometry': geometry, 'properties': dict(feature['properties'])})
+                    # 2D and 3D vertices may be mixed: 2D ones are completed with z=0 and truncated afterwards
+                    nb_columns = max((len(vertex) for vertex in vertices), default=2)
+                    mixed = any(len(vertex) != nb_columns for vertex in vertices)
+                    if mixed:
+                        points = np.array([tuple(vertex) + (0.,)*(nb_columns - len(vertex)) for vertex in vertices],
+                                          dtype=np.float64).reshape(-1, nb_columns)
+                    else:
+                        points = np.array(vertices, dtype=np.float64).reshape(-1, nb_columns)
+                stats.count('rows_parsed', len(points))
+
+                with stats.timer('transform'):
+                    transformation.apply_to_points(points, points)
+                stats.count('rows_transformed', len(points))
+
+                with stats.timer('format'):
+                    if mixed:
+                        new_vertices = iter([tuple(row[:len(vertex)]) for row, vertex in zip(points.tolist(), vertices)])
+                    else:
+                        new_vertices = map(tuple, points.tolist())
+                    for record in records:
+                        if record['geometry'] is not None:
+                            record['geometry']['coordinates'] = rebuild_coordinates(
+                                record['geometry']['coordinates'], new_vertices)
+                with stats.timer('write'):
+                    out_layer.writerecords(records)
+                stats.count('rows_written', len(points))
+
+                nb_vertices += len(points)
+                stats.log_progress(logger)
+    return nb_vertices
+
+
+def transform_arrays(x, y, z, source, target, config):
+    """
+    Transform coordinates from reference frame `source` to `target`, without any file
+    Arguments:
+    * x, y, z = coordinates (numpy arrays or any sequence or buffer of numbers), z can be None
+    * config = ReferenceFrameConfig or path to a xml configuration file (loaded only once)
+    Return the tuple of transformed arrays (x, y, z), z being None if not given
+    Raise ReferenceFrameError if the configuration is not valid or the change of reference frame is not possible
+
+    >>> transform_arrays([0., 1.], [0., 0.], None, 'A', 'B', 'config.xml')  # doctest: +SKIP
+    """
+    if not isinstance(config, ReferenceFrameConfig):
+        try:
+            config = _loaded_configs[config]
+        except KeyError:
+            config = _loaded_configs[config] = ReferenceFrameConfig.load(config, logging.getLogger(__name__))
+    return config.transform_arrays(x, y, z, source, target)
+
+
+def get_output_names(outname, targets):
+    """
+    Return the output file name of each target reference frame
+    `{target}` in `outname` is replaced by the target, otherwise with several targets it is added as a suffix.
+    """
+    if '{target}' in outname:
+        return [outname.replace('{target}', target) for target in targets]
+    if len(targets) == 1:
+        return [outname]
+    name = strip_compression_extension(outname)
+    root, ext = os.path.splitext(name)
+    return ['{}_{}{}{}'.format(root, target, ext, outname[len(name):]) for target in targets]
+
+
+def launch_main(args, logger, stats=None):
+    """
+    Run the change of reference frame described by the command line arguments `args`
+    `stats` (TransformStats) can be given to follow the progress of the run or to cancel it: files created by a
+    cancelled run are removed (except with --incremental) and TransformCancelled is raised.
+    """
+    if stats is None:
+        stats = TransformStats()
+    targets = args.target.split(',')
+    outnames = get_output_names(args.outname_csv, targets)
+    real_outnames = [os.path.realpath(name) for name in outnames]
+    # With a single target, a binary file can be transformed in place (see transform_binary)
+    if len(set(real_outnames)) != len(outnames) or \
+            (len(targets) > 1 and os.path.realpath(args.inname_csv) in real_outnames):
+        sys.exit("Les fichiers de sortie doivent être distincts entre eux et du fichier d'entrée : {}".format(
+            ', '.join(outnames)))
+    transformations = []
+    try:
+        with stats.timer('config'):
+            ref_frame_config = ReferenceFrameConfig.load(args.config_xml, logger, use_cache=not args.no_cache)
+        ref_frame_graph = ref_frame_config.graph
+        logger.info("Liste des repères: {}".format(ref_frame_graph.nodes()))
+
+        # Find path from source to each target
+        for target in targets:
+            with stats.timer('resolve'):
+                path, transformation = ref_frame_config.find_transformation(args.source, target)
+            transformations.append(transformation)
+
+            logger.info("Recherche des transformations pour le changement de repère '{}'->'{}' :".format(
+                args.source, target))
+            for r1, r2 in zip(path[:-1], path[1:]):
+                logger.info("> Changement '{}'->'{}'".format(r1, r2))
+                for elementary_transformation in ref_frame_graph.adj[r1][r2]['function']:
+                    logger.info("    - {}".format(elementary_transformation))
+    except ReferenceFrameError as e:
+        sys.exit(str(e))
+
+    csv_only = not any(is_vector_path(name) or is_binary_path(name) for name in [args.inname_csv] + outnames)
+    if args.incremental and not csv_only:
+        sys.exit("Le mode incrémental ne s'applique qu'aux fichiers CSV")
+    compressed = [name for name in outnames if get_compression(name)]
+    if get_compression(args.inname_csv, read=True):
+        compressed.append(args.inname_csv)
+    for name in compressed:
+        if is_vector_path(strip_compression_extension(name)) or is_binary_path(strip_compression_extension(name)):
+            sys.exit("Seuls les fichiers CSV peuvent être compressés : {}".format(name))
+    if compressed and args.incremental:
+        sys.exit("Le mode incrémental ne s'applique pas aux fichiers compressés : {}".format(', '.join(compressed)))
+    if args.rejects and (is_vector_path(args.inname_csv) or is_binary_path(args.inname_csv) or args.passthrough):
+        sys.exit("Le fichier des lignes rejetées ne s'applique qu'aux fichiers d'entrée CSV, sans --passthrough")
+    if args.sort and (not csv_only or args.incremental or args.passthrough):
+        sys.exit("Le tri spatial ne s'applique qu'aux fichiers CSV, sans --incremental ni --passthrough")
+    if args.tile_index is not None:
+        if not args.sort:
+            sys.exit("L'index des tuiles nécessite un tri spatial (--sort)")
+        if not 0 <= args.tile_index <= SORT_BITS:
+            sys.exit("Le niveau de l'index des tuiles doit être compris entre 0 et {}".format(SORT_BITS))
+        if any(get_compression(name) for name in outnames):
+            sys.exit("L'index des tuiles ne s'applique pas aux fichiers de sortie compressés")
+    created_names = [name for outname in outnames for name in (outname, outname + REJECTS_SUFFIX,
+                                                                outname + TILE_INDEX_SUFFIX)
+                     if not os.path.exists(name)]
+    try:
+        if len(targets) > 1 and csv_only and args.jobs == 1 and \
+                not (args.incremental or args.passthrough or args.sort or args.rejects):
+            # Parse the input file once and write every target
+            mode = 'w' if args.force else 'x'
+            with open_points_file(args.inname_csv, 'r') as in_csv:
+                stats.watch_input(in_csv, args.inname_csv)
+                with contextlib.ExitStack() as stack:
+                    outputs = []
+                    for outname, transformation in zip(outnames, transformations):
+                        outputs.append((stack.enter_context(open_points_file(outname, mode)), transformation))
+                        logger.info("Début écriture {}".format(outname))
+                    nb_points = transform_csv_fanout(in_csv, outputs, args, logger, stats=stats)
+                    logger.info("Fin des fichiers, {} points traités".format(nb_points))
+        else:
+            for target, outname, transformation in zip(targets, outnames, transformations):
+                target_args = copy.copy(args)
+                target_args.target = target
+                target_args.outname_csv = outname
+                launch_transformation(transformation, target_args, logger, stats)
+    except TransformCancelled:
+        logger.warning("Traitement annulé")
+        if not args.incremental:
+            # Only files created by this run are removed, overwritten files (--force) are left incomplete
+            for name in created_names:
+                if os.path.exists(name):
+                    os.remove(name)
+        raise
+
+    stats.log_summary(logger)
+    if args.stats_json:
+        stats.write_json(args.stats_json)
     return 0
 
 
+def launch_transformation(transformation, args, logger, stats):
+    """
+    Transform file `args.inname_csv` into `args.outname_csv`, with the engine matching the files and options
+    With `args.rejects`, faulty rows are written into `<output>.rejects.csv` and summarized at the end.
+    """
+    mode = 'w' if args.force else 'x'
+    rejects = None
+    if args.rejects and not args.incremental:
+        rejects = RowRejects(args.outname_csv + REJECTS_SUFFIX, args.sep, mode)
+    try:
+        nb_points = run_engine(transformation, args, logger, stats, rejects)
+    finally:
+        if rejects is not None:
+            rejects.close()
+    if rejects is not None:
+        stats.count('rows_rejected', sum(rejects.counts.values()))
+        rejects.log_summary(logger)
+    return nb_points
+
+
+def run_engine(transformation, args, logger, stats, rejects=None):
+    """Run the engine matching the files and options, faulty rows go to `rejects` (RowRejects) if given"""
+    mode = 'w' if args.force else 'x'
+    if is_vector_path(args.inname_csv) or is_vector_path(args.outname_csv):
+        # Geometries of a shapefile or GeoPackage layer
+        if not (is_vector_path(args.inname_csv) and is_vector_path(args.outname_csv)):
+            sys.exit("Les fichiers d'entrée et de sortie doivent être tous les deux des couches vectorielles ({})".format(
+                ', '.join(VECTOR_DRIVERS)))
+        logger.info("Début écriture {}".format(args.outname_csv))
+        nb_points = transform_vector_layer(transformation, args, logger, stats)
+        logger.info("Fin du fichier, {} sommets traités".format(nb_points))
+    elif args.compact is not None:
+        # Float32 offsets from a local origin
+        logger.info("Début écriture {}".format(args.outname_csv))
+        nb_points = transform_compact(transformation, args, logger, stats)
+        logger.info("Fin du fichier, {} points traités".format(nb_points))
+    elif is_binary_path(args.inname_csv) or is_binary_path(args.outname_csv):
+        # Coordinates only, memory-mapped when possible
+        logger.info("Début écriture {}".format(args.outname_csv))
+        nb_points = transform_binary(transformation, args, logger, stats, rejects)
+        logger.info("Fin du fichier, {} points traités".format(nb_points))
+    elif args.sort:
+        # Rows sorted along a space-filling curve
+        with open_points_file(args.inname_csv, 'r') as in_csv:
+            stats.watch_input(in_csv, args.inname_csv)
+            with open_points_file(args.outname_csv, mode) as out_csv:
+                logger.info("Début écriture {} (tri spatial : {})".format(args.outname_csv, args.sort))
+                nb_points = transform_csv_sorted(in_csv, out_csv, transformation, args, logger, stats, rejects)
+                logger.info("Fin du fichier, {} points traités".format(nb_points))
+    elif args.incremental:
+        # Only rows appended since the last run
+        logger.info("Début écriture {}".format(args.outname_csv))
+        nb_points = transform_csv_incremental(transformation, args, logger, stats)
+        logger.info("Fin du fichier, {} points ajoutés".format(nb_points))
+    elif args.jobs > 1 and rejects is None and get_compression(args.inname_csv, read=True) is None:
+        # Compute transformation over byte ranges of the input file in parallel
+        with open_points_file(args.outname_csv, mode + 'b') as out_csv:
+            logger.info("Début écriture {}".format(args.outname_csv))
+            nb_points = transform_csv_parallel(out_csv, transformation, args, logger, stats)
+            logger.info("Fin du fichier, {} points traités".format(nb_points))
+    else:
+        # Compute transformation over the input file, block by block (compressed input can not be split for --jobs,
+        # row numbers of rejects are only known by a single process)
+        if args.jobs > 1:
+            logger.warning("Option --jobs ignorée : {}, traitement dans un seul processus".format(
+                "lignes rejetées demandées (--rejects)" if rejects is not None else "fichier d'entrée compressé"))
+        with open_points_file(args.inname_csv, 'r') as in_csv:
+            stats.watch_input(in_csv, args.inname_csv)
+            with open_points_file(args.outname_csv, mode) as out_csv:
+                logger.info("Début écriture {}".format(args.outname_csv))
+                nb_points = transform_csv_stream(in_csv, out_csv, transformation, args, logger, stats=stats,
+                                                 rejects=rejects)
+                logger.info("Fin du fichier, {} points traités".format(nb_points))
+    return nb_points
+
+
 if __name__ == "__main__":
     # logging.basicConfig()  # format="%(levelname)s: %(message)s"
 
     from common.arg_command_line import myargparse
     parser = myargparse(description=__doc__, add_args=['force', 'verbose'], lang='fr')
-    parser.add_argument("inname_csv", help="Fichier d'entrée csv")
-    parser.add_argument("outname_csv", help="Fichier de sortie csv")
+    parser.add_argument("inname_csv", help="Fichier d'entrée csv, éventuellement compressé ({}) (ou binaire : {}, "
+                                           "ou couche vectorielle : {})".format(
+        ', '.join(COMPRESSIONS), ', '.join(BINARY_EXTENSIONS), ', '.join(VECTOR_DRIVERS)))
+    parser.add_argument("outname_csv", help="Fichier de sortie csv, compressé selon son extension ({}) (ou binaire : {}, "
+                                            "ou couche vectorielle : {})".format(
+        ', '.join(COMPRESSIONS), ', '.join(BINARY_EXTENSIONS), ', '.join(VECTOR_DRIVERS)))
     parser.add_argument("config_xml", help="Fichier de configuration xml des repères")
     parser.add_argument("source", help="Repère en entrée")
-    parser.add_argument("target", help="Repère en sortie")
+    parser.add_argument("target", help="Repère en sortie, ou liste de repères séparés par des virgules (un fichier de "
+                                       "sortie par repère : `{target}` dans le nom de sortie est remplacé par le repère, "
+                                       "sinon le repère est ajouté en suffixe)")
     parser.add_argument("--x", help="Nom de la colonne x", default='x')
     parser.add_argument("--y", help="Nom de la colonne y", default='y')
-    parser.add_argument("--z", help="Nom de la colonne z")
+    parser.add_argument("--z", help="Nom de la colonne z (pour un fichier binaire brut .bin : indique la présence de z)")
     parser.add_argument("--sep", help="Sépérateur de colonnes", default=';')
     parser.add_argument("--digits", type=int, help="Nombre de chiffres significatifs des flottants à écrire", default=4)
+    parser.add_argument("--chunk-size", type=int, help="Nombre de lignes (ou d'objets d'une couche vectorielle) lues et transformées par bloc (borne la mémoire utilisée)", default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--layer", help="Nom de la couche à lire (GeoPackage)")
+    parser.add_argument("--stats-json", help="Fichier JSON des durées par étape et des compteurs de lignes")
+    parser.add_argument("--no-cache", help="Relire le fichier xml sans utiliser ni mettre à jour le cache de configuration", action="store_true")
+    parser.add_argument("--rejects", help="Écrire les lignes invalides (coordonnées non numériques ou manquantes, résultat "
+                                          "non fini) dans `<sortie>{}` au lieu d'arrêter le traitement".format(
+                                              REJECTS_SUFFIX), action="store_true")
+    parser.add_argument("--sort", choices=SORT_CURVES,
+                        help="Trier les lignes le long d'une courbe de remplissage dans le repère en sortie (tri externe, "
+                             "mémoire bornée par --chunk-size)")
+    parser.add_argument("--tile-index", type=int, metavar="LEVEL",
+                        help="Avec --sort, écrire l'index des tuiles (plages d'octets) dans `<sortie>{}` : "
+                             "4^LEVEL tuiles".format(TILE_INDEX_SUFFIX))
+    parser.add_argument("--compact", type=float, metavar="TOLERANCE",
+                        help="Écrire un fichier .npz compact (décalages float32 par rapport à une origine locale) depuis "
+                             "un fichier binaire, si l'erreur maximale ne dépasse pas la tolérance donnée (en unités "
+                             "des coordonnées)")
+    parser.add_argument("--passthrough", help="Recopier les lignes telles quelles en ne remplaçant que les champs x, y "
+                                              "(et z) : autres colonnes, guillemets et fins de ligne inchangés",
+                        action="store_true")
+    parser.add_argument("--incremental", help="Ne transformer que les lignes ajoutées au fichier CSV d'entrée depuis le "
+                                              "dernier traitement (point de reprise `<sortie>{}`, ignore --jobs)".format(
+                                                  CHECKPOINT_SUFFIX), action="store_true")
+    parser.add_argument("--jobs", "-j", type=int, help="Nombre de processus pour traiter le fichier en parallèle (sans retour à la ligne dans les champs)", default=1)
     args = parser.parse_args()
 
     if args.verbose:
@@ -343,8 +2172,12 @@ if __name__ == "__main__":
         logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
     logger = logging.getLogger(__name__)
 
+    # Run the importable module, so that pickled objects (configuration cache, processes) refer to its classes
+    # and not to `__main__`
+    import ChangementReperes
+
     try:
-        launch_main(args, logger)
+        ChangementReperes.launch_main(args, logger)
     except SystemError as e:
         logger.fatal(e)
         logger.fatal("L'exécution a échoué à cause de l'erreur ci-dessus")
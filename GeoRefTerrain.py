@@ -8,34 +8,49 @@ L'horodatage des photos utilisé est la date de prise de vue.
 Ce comportement peut être changé si nécessaire avec l'option `--date_type` (en spécifiant un entier)
 En général, on utilisera l'argument `--decal_temps` pour faire correspondre les dates du GPS et de l'appareil photo.
 
+Les méta-données lues dans les images sont conservées dans un cache (base SQLite dans le dossier utilisateur) : lors
+des exécutions suivantes, seuls les fichiers nouveaux ou modifiés (taille ou date de modification) sont relus.
+L'option `--rebuild-cache` vide ce cache et `--no-cache` ne l'utilise pas.
+
 Les exports possibles sont :
 * `kml` : trace GPS et géolocalisation des photos
 * `shp`
 ** Semis de points : géolocalisation des photos
 ** Polylignes : trace GPS
 """
+import collections
+import concurrent.futures
 import datetime
 import fiona
 from jinja2 import Environment, FileSystemLoader
 from glob import glob
 import logging
 import numpy as np
-import os.path
-from PIL import Image
-from PIL.ExifTags import TAGS
+import os
 import shapely.geometry as geom
 from shapely.geometry import mapping
+import sqlite3
 import sys
+import threading
 import xml.etree.ElementTree as ET
 
-from common.read_gps_medatadata import get_exif_data, get_lat_lon
+from common.read_gps_medatadata import get_altitude, get_exif_data_from_file, get_lat_lon
 
 
 # Lowercase only because corresponding uppercase extensions are appended automatically by glob
 EXTENSIONS = ['jpg', 'jpeg', 'png']
+DEFAULT_JOBS = min(32, (os.cpu_count() or 1) + 4)  # image reading is I/O bound
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'ModelerTools', 'GeoRefTerrain', 'metadata.sqlite')
+CACHE_VERSION = 2  # to increment if the content of PictureMetadata changes
 
 logger = logging.getLogger(__name__)
 
+# Metadata of a picture read in a single pass (file system dates as timestamps, EXIF date as string, None if missing)
+PictureMetadata = collections.namedtuple('PictureMetadata', ['creation_time', 'modification_time', 'date_taken',
+                                                             'lat', 'lon', 'ele', 'orientation'])
+# Fields read from the file content, stored by MetadataCache (file system dates always come from os.stat)
+EXIF_FIELDS = PictureMetadata._fields[2:]
+
 
 class Point:
     """
@@ -70,8 +85,9 @@ class Picture:
     Attributes :
     * path = local or absolute path to picture
     * point = Point location
+    * metadata = PictureMetadata, read at the first access to a date or the GPS position
     """
-    code_DateTimeDigitized = None
+    DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
     DATE_TYPES = {
         # Dict format: id, (label, method name)
         1: ('Date de création', 'get_creation_date'),
@@ -87,46 +103,65 @@ class Picture:
                 return id
         sys.exit("Le type de date '{}' n'est pas reconstituable".format(label2find))
 
-    def __init__(self, path, point, link, label):
+    def __init__(self, path, point, link, label, cache=None):
         self.path = path
         self.point = point
         self.link = link
         self.label = label
         self.abs_path = os.path.abspath(self.path)
-
-        if not Picture.code_DateTimeDigitized:
-            Picture.find_DateTimeDigitized_code()
-
-    @staticmethod
-    def find_DateTimeDigitized_code():
-        """Find which code corresponds to the TAG `DateTimeDigitized`"""
-        for c, value in TAGS.items():
-            if value=='DateTimeDigitized':
-                Picture.code_DateTimeDigitized = c
-                break
+        self.cache = cache  # MetadataCache or None
+        self._metadata = None
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = self.read_metadata()
+        return self._metadata
+
+    def read_metadata(self):
+        """Read all the metadata used (file dates, EXIF date, GPS position and orientation) with one header read"""
+        stat = os.stat(self.path)
+        if self.cache is not None:
+            metadata = self.cache.get(self.abs_path, stat)
+            if metadata is not None:
+                return metadata
+
+        exif_data = get_exif_data_from_file(self.path)
+        lat, lon = get_lat_lon(exif_data)
+        metadata = PictureMetadata(
+            creation_time=stat.st_ctime,
+            modification_time=stat.st_mtime,
+            date_taken=exif_data.get('DateTimeDigitized'),
+            lat=lat,
+            lon=lon,
+            ele=get_altitude(exif_data),
+            orientation=exif_data.get('Orientation'),
+        )
+        if self.cache is not None:
+            self.cache.put(self.abs_path, stat, metadata)
+        return metadata
 
     def set_position_from_gps_metadata(self):
-        image = Image.open(self.path)
-        exif_data = get_exif_data(image)
-        lat, lon = get_lat_lon(exif_data)
+        lat, lon = self.metadata.lat, self.metadata.lon
         if not lat or not lon:
             raise Exception("Aucune coordonnée GPS renseignée dans le fichier '{}'".format(self.path))
-        ele = 0  #FIXME: elevation from GPS metadata
+        ele = self.metadata.ele
+        if ele is None:
+            ele = 0
         self.point.set_coord(lat, lon, ele)
 
     def get_date_taken(self):
         try:
-            info = Image.open(self.path)._getexif()
-            return datetime.datetime.strptime(info[Picture.code_DateTimeDigitized], '%Y:%m:%d %H:%M:%S')
-        except (KeyError, AttributeError):
+            return datetime.datetime.strptime(self.metadata.date_taken, Picture.DATE_FORMAT)
+        except (TypeError, ValueError):
             logger.critical("Aucune date de prise de vue pour le fichier '{}'".format(self.path))
             sys.exit(1)
 
     def get_modification_date(self):
-        return datetime.datetime.fromtimestamp(round(os.path.getmtime(self.path), 0))
+        return datetime.datetime.fromtimestamp(round(self.metadata.modification_time, 0))
 
     def get_creation_date(self):
-        return datetime.datetime.fromtimestamp(round(os.path.getctime(self.path), 0))
+        return datetime.datetime.fromtimestamp(round(self.metadata.creation_time, 0))
 
     def get_date(self, date_type):
         if date_type in Picture.DATE_TYPES.keys():
@@ -142,81 +177,149 @@ class Picture:
         return "PICTURE: {} ({})".format(self.path, self.point)
 
 
+class MetadataCache:
+    """
+    Persistent cache of the EXIF fields of PictureMetadata (SQLite database), keyed by absolute path, size and
+    modification time
+    The connection is shared by the threads of list_images, new records are committed by `close`.
+    """
+    def __init__(self, path=CACHE_PATH, rebuild=False):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if rebuild or version != CACHE_VERSION:
+            self._connection.execute("DROP TABLE IF EXISTS pictures")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS pictures (path TEXT PRIMARY KEY, size INTEGER, "
+                                 "mtime_ns INTEGER, {})".format(', '.join(EXIF_FIELDS)))
+        self._connection.execute("PRAGMA user_version = {}".format(CACHE_VERSION))
+        self._connection.commit()
+        self.nb_hits = 0
+        self.nb_misses = 0
+
+    def get(self, abs_path, stat):
+        """Return the cached PictureMetadata of the file (`stat` is its os.stat result) or None if unknown or modified"""
+        with self._lock:
+            row = self._connection.execute("SELECT size, mtime_ns, {} FROM pictures WHERE path = ?".format(
+                ', '.join(EXIF_FIELDS)), (abs_path,)).fetchone()
+            if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+                self.nb_misses += 1
+                return None
+            self.nb_hits += 1
+        return PictureMetadata(stat.st_ctime, stat.st_mtime, *row[2:])
+
+    def put(self, abs_path, stat, metadata):
+        values = tuple(getattr(metadata, field) for field in EXIF_FIELDS)
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO pictures VALUES (?, ?, ?, {})".format(
+                ', '.join('?'*len(values))), (abs_path, stat.st_size, stat.st_mtime_ns) + values)
+
+    def close(self):
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+
+def open_metadata_cache(args):
+    """Return the MetadataCache to use according to `args` (None if disabled or unavailable)"""
+    if args.no_cache:
+        return None
+    try:
+        return MetadataCache(rebuild=args.rebuild_cache)
+    except (OSError, sqlite3.Error) as e:
+        logger.warn("Impossible d'utiliser le cache des méta-données : {}".format(e))
+        return None
+
+
 class Gpx:
     """
+    First segment of the first track of a GPX file, read as a stream into arrays (one value per track point)
     Attributes:
-    * track: list of Point objects
+    * lat, lon, ele: float64 arrays (missing elevation = 0)
+    * times: datetime64[ms] array (UTC)
+    * name: name of the track (None if missing)
     """
     PREFFIX = '{http://www.topografix.com/GPX/1/1}'
-    DATEFORMAT = '%Y-%m-%dT%H:%M:%SZ'
+    CHUNK_SIZE = 65536  # track points converted to arrays at once
 
     def __init__(self, gpx_path):
-        self._root = ET.parse(gpx_path).getroot()
-        self._trk_child = None
-        self.track = []
+        self.name = None
+        self._chunks = {'lat': [], 'lon': [], 'ele': [], 'times': []}
+        self._read_first_trkseg(gpx_path)
+        if len(self.times) == 0:
+            sys.exit("Aucun point dans le premier segment de la trace '{}'".format(gpx_path))
+
+    def _read_first_trkseg(self, gpx_path):
+        trk_tag, trkseg_tag, trkpt_tag = self.PREFFIX+'trk', self.PREFFIX+'trkseg', self.PREFFIX+'trkpt'
+        name_tag, ele_tag, time_tag = self.PREFFIX+'name', self.PREFFIX+'ele', self.PREFFIX+'time'
+        # Text values of the current chunk, converted together by _add_chunk
+        lats, lons, eles, times = [], [], [], []
+        trk = trkseg = trkpt = None
+        ele = time = None
+
+        for event, elem in ET.iterparse(gpx_path, events=('start', 'end')):
+            if event == 'start':
+                if trkseg is not None and elem.tag == trkpt_tag:
+                    trkpt = elem
+                    lats.append(elem.get('lat'))
+                    lons.append(elem.get('lon'))
+                    ele = time = None
+                elif trk is not None and trkseg is None and elem.tag == trkseg_tag:
+                    trkseg = elem
+                elif trk is None and elem.tag == trk_tag:
+                    trk = elem
+            elif trkpt is not None:
+                if elem.tag == ele_tag:
+                    ele = elem.text
+                elif elem.tag == time_tag:
+                    time = elem.text
+                elif elem is trkpt:
+                    if time is None:
+                        sys.exit("Point de trace sans date dans '{}' (lat={}, lon={})".format(
+                            gpx_path, lats[-1], lons[-1]))
+                    eles.append(ele if ele is not None else 0)
+                    times.append(time)
+                    # Free the parsed points: memory does not grow with the length of the track
+                    trkseg.remove(trkpt)
+                    trkpt = None
+                    if len(times) == self.CHUNK_SIZE:
+                        self._add_chunk(lats, lons, eles, times)
+                        lats, lons, eles, times = [], [], [], []
+            elif elem is trkseg:
+                # Only the first segment is read
+                break
+            elif trk is not None and trkseg is None and elem.tag == name_tag and self.name is None:
+                self.name = elem.text
+
+        self._add_chunk(lats, lons, eles, times)
+        for key, chunks in self._chunks.items():
+            setattr(self, key, np.concatenate(chunks))
+        del self._chunks
+
+    def _add_chunk(self, lats, lons, eles, times):
+        self._chunks['lat'].append(np.array(lats, dtype=np.float64))
+        self._chunks['lon'].append(np.array(lons, dtype=np.float64))
+        self._chunks['ele'].append(np.array(eles, dtype=np.float64))
+        # ISO 8601 dates ending with 'Z' (UTC), with or without fractions of second
+        self._chunks['times'].append(np.char.rstrip(np.array(times, dtype=str), 'Z').astype('datetime64[ms]'))
 
     def track_starting_date(self):
-        return self.track[0].date
+        return self.times[0].astype(datetime.datetime)
 
     def track_ending_date(self):
-        return self.track[-1].date
-
-    def _set_trk(self):
-        if self._trk_child is None:
-            self._trk_child = self._root.find(self.PREFFIX+'trk')
+        return self.times[-1].astype(datetime.datetime)
 
     def get_trk_name(self):
-        self._set_trk()
-        return self._trk_child.find(self.PREFFIX+'name').text
+        return self.name
 
     def get_starting_time(self):
-        self._set_trk()
-        trkpt = self._trk_child.find(self.PREFFIX+'trkseg')[0]
-        time = trkpt.find(self.PREFFIX+'time').text
-        return datetime.datetime.strptime(time, self.DATEFORMAT)
-
-    def iter_on_first_trkseg(self):
-        self._set_trk()
-        starting_date = self.get_starting_time()
-        logger.debug("Starting date = {}".format(starting_date))
-
-        for trkpt in self._trk_child.find(self.PREFFIX+'trkseg'):
-            point = Point()
-            pt_dict = trkpt.attrib  # create 'lat' and 'lon' keys
-
-            # Get coordinates
-            lat = float(pt_dict['lat'])
-            lon = float(pt_dict['lon'])
-            ele = float(trkpt.find(self.PREFFIX+'ele').text)
-            point.set_coord(lat, lon, ele)
-
-            # Get date
-            date_str = trkpt.find(self.PREFFIX+'time').text
-            date = datetime.datetime.strptime(date_str, self.DATEFORMAT)
-            # time = (pt_dict['date'] - starting_date).total_seconds()
-            point.set_date(date)
-
-            # logger.debug(point)
-            self.track.append(point)
-
-    # def iter_images_on_first_trkseg(self):
-    #     self._set_trk()
-
-    #     for trkpt in self._trk_child.find(self.PREFFIX+'trkseg'):
-    #         time = trkpt.find(self.PREFFIX+'time').text
-    #         date = datetime.datetime.strptime(time, self.DATEFORMAT)
-
-    #         image.set_coordinates(
-    #             lat=trkpt.attrib['lat'],
-    #             lon=trkpt.attrib['lat'],
-    #             ele=trkpt.find(self.PREFFIX+'ele').text
-    #         )
+        return self.track_starting_date()
 
 
 class TrackAndWayPoint:
-    def __init__(self, track=[], images=[]):
+    def __init__(self, track=None, images=[]):
         """
-        :param track: list of Point objects
+        :param track: Gpx object or None
         :param images: list of Image objects
         """
         self.track = track
@@ -231,11 +334,10 @@ class TrackAndWayPoint:
         self.zero_date = date
 
     def compute_arrays(self, timedelta=0):
-        self.array_lat = np.array([pt.lat for pt in self.track])
-        self.array_lon = np.array([pt.lon for pt in self.track])
-        self.array_ele = np.array([pt.ele for pt in self.track])
-        # self.array_date = np.array([pt.date for pt in self.track])
-        self.array_time = np.array([(pt.date - self.zero_date).total_seconds() + timedelta for pt in self.track])
+        self.array_lat = self.track.lat
+        self.array_lon = self.track.lon
+        self.array_ele = self.track.ele
+        self.array_time = (self.track.times - np.datetime64(self.zero_date, 'ms')) / np.timedelta64(1, 's') + timedelta
         self.min_time = np.amin(self.array_time)
         self.max_time = np.amax(self.array_time)
 
@@ -249,7 +351,8 @@ class TrackAndWayPoint:
         with open(outpath, 'w') as fileout:
             fileout.write(template.render(
                 images=self.images,
-                points=self.track,
+                points=[] if self.track is None else zip(self.track.lon.tolist(), self.track.lat.tolist(),
+                                                         self.track.ele.tolist()),
                 color="d2ffe1",
                 opacity="ff",
             ))
@@ -271,36 +374,67 @@ class TrackAndWayPoint:
     def write_shp_lines(self, outpath):
         schema = {'geometry': '3D LineString', 'properties': {'FID': 'int'}}
         with fiona.open(outpath, 'w', 'ESRI Shapefile', schema) as layer:
-            linestring = geom.LineString([(pt.lon, pt.lat, pt.ele) for pt in self.track])
+            linestring = geom.LineString(np.column_stack([self.track.lon, self.track.lat, self.track.ele]))
             elem = {}
             elem['geometry'] = mapping(linestring)
             elem['properties'] = {'FID': 0}
             layer.write(elem)
 
-def list_images(folder, no_folder, date_type):
-    #FIXME: use yield?
-    liste = []
+def read_picture(image_path, no_folder, date_type, gps=False, cache=None):
+    """
+    Build the Picture object of `image_path` and read its metadata (date and, if `gps`, position)
+    Return None if `gps` is requested but the file has no GPS coordinates
+    """
+    image_basename = os.path.basename(image_path)
+    if no_folder:
+        image_link = image_basename
+    else:
+        image_link = image_path
+    image = Picture(image_path, Point(), image_link, image_basename, cache)
+    image.set_date(date_type)
+    if gps:
+        try:
+            image.set_position_from_gps_metadata()
+        except Exception as e:
+            logger.debug(e)
+            return None
+    return image
+
+
+def list_images(folder, no_folder, date_type, jobs=1, gps=False, cache=None):
+    """
+    Return the list of Picture objects of `folder` (sorted by extension then by path)
+    Metadata are read by `jobs` threads (file reading is mostly waiting for the disk or the network), the order of
+    the list does not depend on `jobs`. If `gps`, pictures without GPS coordinates are skipped.
+    Metadata of unmodified files are taken from `cache` (MetadataCache) if given.
+    """
+    paths = []
     for ext in EXTENSIONS:
-        for image_path in glob(os.path.join(folder, '*' + ext)):
-            image_basename = os.path.basename(image_path)
-            if no_folder:
-                image_link = image_basename
-            else:
-                image_link = image_path
-            image = Picture(image_path, Point(), image_link, image_basename)
-            image.set_date(date_type)
-            liste.append(image)
-    return liste
+        paths.extend(sorted(glob(os.path.join(folder, '*' + ext))))
+
+    if jobs > 1:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        try:
+            # map returns results in the order of `paths`
+            images = list(executor.map(lambda path: read_picture(path, no_folder, date_type, gps, cache), paths))
+        except BaseException:
+            # A picture stopped the run (sys.exit without date taken): do not read the pictures still queued
+            executor.shutdown(cancel_futures=True)
+            raise
+        executor.shutdown()
+    else:
+        images = [read_picture(path, no_folder, date_type, gps, cache) for path in paths]
+    return [image for image in images if image is not None]
 
 def launch_main(args, logger):
     """Launch main"""
     if args.gpx:
         logger.info("Lecture de la trace {}".format(args.gpx))
         gpx = Gpx(args.gpx)
-        gpx.iter_on_first_trkseg()
-        track = gpx.track
+        logger.debug("Starting date = {}".format(gpx.get_starting_time()))
+        track = gpx
     else:
-        track = []
+        track = None
 
     mykml = TrackAndWayPoint(track=track, images=[])
 
@@ -309,7 +443,16 @@ def launch_main(args, logger):
     first = True
 
     logger.info("Parcours du dossier : {}".format(args.inname_folder))
-    for image in list_images(args.inname_folder, args.no_folder, args.date_type):
+    cache = open_metadata_cache(args)
+    try:
+        image_list = list_images(args.inname_folder, args.no_folder, args.date_type, jobs=args.jobs,
+                                 gps=not args.interpolation, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
+            logger.info("Cache des méta-données : {} fichiers lus dans le cache, {} fichiers relus".format(
+                cache.nb_hits, cache.nb_misses))
+    for image in image_list:
 
         if args.interpolation:
             if not args.gpx:
@@ -333,11 +476,6 @@ def launch_main(args, logger):
             lon = np.interp(time, mykml.array_time, mykml.array_lon)
             ele = np.interp(time, mykml.array_time, mykml.array_ele)
             image.point.set_coord(lat, lon, ele)
-        else:
-            try:
-                image.set_position_from_gps_metadata()
-            except Exception:
-                continue
 
         mykml.append_image(image)
 
@@ -373,6 +511,9 @@ if __name__ == '__main__':
     parser.add_argument("--no_folder", help="les chemins exportés ne contiennent pas de dossier", action="store_true")
     parser.add_argument("--interpolation", help="interpole les coordonnées des images à partir de la trace (dans ce cas l'argument `--decal-temps` est utilisée)", action="store_true")
     parser.add_argument("--decal_temps", help="différence temporelle entre les dates de la trace et des images (en secondes)", type=float, default=0)
+    parser.add_argument("--jobs", "-j", help="nombre de fichiers images lus en parallèle", type=int, default=DEFAULT_JOBS)
+    parser.add_argument("--no-cache", help="relire toutes les images sans utiliser ni mettre à jour le cache des méta-données", action="store_true")
+    parser.add_argument("--rebuild-cache", help="vider le cache des méta-données avant de relire les images", action="store_true")
 
     # OUTPUTS
     parser.add_argument("--kml", help="fichier KML de sortie")
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Banc d'essai de ChangementReperes
+
+Des semis de points CSV et des fichiers de configuration xml synthétiques sont générés, puis chaque cas est exécuté
+dans un nouveau processus pour mesurer :
+* le temps de démarrage (petit fichier, avec et sans le cache de configuration) selon le nombre de repères et la
+longueur de la suite de transformations ;
+* le débit (points/s) et la mémoire maximale (RSS) selon le nombre de lignes et le moteur utilisé :
+`csv` (par défaut), `csv-jobs` (option --jobs), `npy` (fichiers binaires) et `api` (fonction transform_arrays).
+Le débit est toujours calculé sur la durée totale du processus ; pour `api`, le temps passé dans transform_arrays seul
+est aussi donné (`transform_s`).
+
+Les résultats sont écrits au format JSON (`--output`) pour comparer les versions entre elles.
+"""
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(REPO_FOLDER)
+
+from common.arg_command_line import myargparse
+
+
+SCRIPT = os.path.join(REPO_FOLDER, 'ChangementReperes.py')
+ENGINES = ['csv', 'csv-jobs', 'npy', 'api']
+STARTUP_ROWS = 100
+GENERATION_BLOCK = 1000000
+
+API_CODE = """
+import sys, time
+import numpy as np
+sys.path.insert(0, {repo!r})
+from ChangementReperes import transform_arrays
+points = np.load({inname!r})
+start = time.perf_counter()
+transform_arrays(points[:, 0], points[:, 1], points[:, 2], 'F0', 'F1', {config!r})
+print(time.perf_counter() - start)
+"""
+
+
+def write_config(path, nb_frames, nb_transformations, seed=0):
+    """
+    Write a xml configuration with `nb_frames` reference frames F0, F1, ... linked as a random tree
+    The change F0->F1 is a chain of `nb_transformations` elementary transformations
+    """
+    rand = random.Random(seed)
+
+    def random_transformation():
+        kind = rand.choice(['Translation', 'Rotation', 'Homothecy'])
+        if kind == 'Translation':
+            return '<Translation x="{:.3f}" y="{:.3f}" z="{:.3f}"/>'.format(
+                rand.uniform(-1e5, 1e5), rand.uniform(-1e5, 1e5), rand.uniform(-10, 10))
+        elif kind == 'Rotation':
+            return '<Rotation angle="{:.4f}" center="{:.3f},{:.3f}"/>'.format(
+                rand.uniform(-180, 180), rand.uniform(-1e3, 1e3), rand.uniform(-1e3, 1e3))
+        else:
+            return '<Homothecy kh="{:.4f}" kv="{:.4f}" center="{:.3f},{:.3f}"/>'.format(
+                rand.uniform(0.01, 100), rand.uniform(0.01, 100), rand.uniform(-1e3, 1e3), rand.uniform(-1e3, 1e3))
+
+    lines = ['<Config>', '  <ReferenceFrames>']
+    for i in range(nb_frames):
+        lines.append('    <ReferenceFrame id="F{0}" name="Repère {0}"/>'.format(i))
+    lines += ['  </ReferenceFrames>', '  <ChangesInReferenceFrames>']
+    for i in range(1, nb_frames):
+        parent = 0 if i == 1 else rand.randrange(i)
+        nb = nb_transformations if i == 1 else rand.randint(1, 3)
+        lines.append('    <Change from="F{}" to="F{}">'.format(parent, i))
+        lines += ['      ' + random_transformation() for _ in range(nb)]
+        lines.append('    </Change>')
+    lines += ['  </ChangesInReferenceFrames>', '</Config>']
+    with open(path, 'w') as fileout:
+        fileout.write('\n'.join(lines) + '\n')
+
+
+def write_csv(path, nb_rows, seed=0):
+    """Write a CSV point cloud (columns id, x, y, z, code) with `nb_rows` rows"""
+    rand = np.random.default_rng(seed)
+    with open(path, 'w', newline='') as fileout:
+        fileout.write("id;x;y;z;code\n")
+        for start in range(0, nb_rows, GENERATION_BLOCK):
+            nb = min(GENERATION_BLOCK, nb_rows - start)
+            data = np.column_stack([np.arange(start, start + nb),
+                                    rand.uniform(0, 5000, nb), rand.uniform(0, 5000, nb), rand.uniform(0, 100, nb),
+                                    rand.integers(0, 100, nb)])
+            np.savetxt(fileout, data, fmt=['%d', '%.3f', '%.3f', '%.3f', '%d'], delimiter=';')
+
+
+def run(command):
+    """
+    Run `command` in a new process and return (elapsed time in seconds, peak RSS in bytes, stdout)
+    Peak RSS is None if it can not be measured on this platform
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    stdout = process.stdout.read()
+    if hasattr(os, 'wait4'):
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_rss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss*1024
+    else:
+        process.wait()
+        peak_rss = None
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError("La commande a échoué : {}".format(' '.join(command)))
+    return elapsed, peak_rss, stdout.decode()
+
+
+def cli_command(inname, outname, config_xml, *options):
+    return [sys.executable, SCRIPT, inname, outname, config_xml, 'F0', 'F1', '--z', 'z', '--force'] + list(options)
+
+
+def bench_startup(folder, frames_list, chains_list, repeat):
+    results = []
+    inname = os.path.join(folder, 'startup.csv')
+    outname = os.path.join(folder, 'startup_out.csv')
+    write_csv(inname, STARTUP_ROWS)
+    for nb_frames in frames_list:
+        for nb_transformations in chains_list:
+            config_xml = os.path.join(folder, 'config_{}_{}.xml'.format(nb_frames, nb_transformations))
+            write_config(config_xml, nb_frames, nb_transformations)
+            for cached in (False, True):
+                options = [] if cached else ['--no-cache']
+                if cached:
+                    run(cli_command(inname, outname, config_xml))  # fill the cache
+                times = [run(cli_command(inname, outname, config_xml, *options))[0] for _ in range(repeat)]
+                results.append({
+                    'benchmark': 'startup',
+                    'frames': nb_frames,
+                    'transformations': nb_transformations,
+                    'rows': STARTUP_ROWS,
+                    'cache': cached,
+                    'startup_s': min(times),
+                })
+                print("startup: {} repères, {} transformations, cache={}: {:.3f}s".format(
+                    nb_frames, nb_transformations, cached, min(times)), file=sys.stderr)
+    return results
+
+
+def bench_throughput(folder, rows_list, engines, jobs, nb_frames, nb_transformations):
+    results = []
+    config_xml = os.path.join(folder, 'config_throughput.xml')
+    write_config(config_xml, nb_frames, nb_transformations)
+    warmup = os.path.join(folder, 'warmup.csv')
+    write_csv(warmup, STARTUP_ROWS)
+    run(cli_command(warmup, os.path.join(folder, 'warmup_out.csv'), config_xml))  # fill the cache
+    for nb_rows in rows_list:
+        inname = os.path.join(folder, 'points_{}.csv'.format(nb_rows))
+        inname_npy = os.path.join(folder, 'points_{}.npy'.format(nb_rows))
+        write_csv(inname, nb_rows)
+        if 'npy' in engines or 'api' in engines:
+            # Conversion without any change of reference frame
+            run([sys.executable, SCRIPT, inname, inname_npy, config_xml, 'F0', 'F0', '--z', 'z', '--force'])
+
+        for engine in engines:
+            if engine == 'csv':
+                command = cli_command(inname, os.path.join(folder, 'out.csv'), config_xml)
+            elif engine == 'csv-jobs':
+                command = cli_command(inname, os.path.join(folder, 'out.csv'), config_xml, '--jobs', str(jobs))
+            elif engine == 'npy':
+                command = cli_command(inname_npy, os.path.join(folder, 'out.npy'), config_xml)
+            else:
+                command = [sys.executable, '-c', API_CODE.format(repo=REPO_FOLDER, inname=inname_npy, config=config_xml)]
+            elapsed, peak_rss, stdout = run(command)
+            result = {
+                'benchmark': 'throughput',
+                'engine': engine,
+                'jobs': jobs if engine == 'csv-jobs' else 1,
+                'rows': nb_rows,
+                'frames': nb_frames,
+                'transformations': nb_transformations,
+                'elapsed_s': elapsed,
+                'points_per_s': nb_rows/elapsed,
+                'peak_rss_bytes': peak_rss,
+            }
+            if engine == 'api':
+                # Time spent in transform_arrays only, without interpreter start-up and loading of the points
+                result['transform_s'] = float(stdout)
+            results.append(result)
+            print("throughput: {} lignes, {}: {:.3f}s ({:.0f} points/s)".format(
+                nb_rows, engine, elapsed, nb_rows/elapsed), file=sys.stderr)
+
+        for path in (inname, inname_npy):
+            if os.path.exists(path):
+                os.remove(path)
+    return results
+
+
+def main():
+    parser = myargparse(description=__doc__, lang='fr')
+    parser.add_argument("--output", "-o", help="Fichier JSON des résultats (sinon sortie standard)")
+    parser.add_argument("--rows", type=int, nargs='+', help="Nombres de lignes des semis de points (jusqu'à 10^8)",
+                        default=[10**4, 10**5, 10**6])
+    parser.add_argument("--frames", type=int, nargs='+', help="Nombres de repères des configurations",
+                        default=[2, 10, 50])
+    parser.add_argument("--chains", type=int, nargs='+', help="Nombres de transformations du changement de repère",
+                        default=[1, 5, 10])
+    parser.add_argument("--engines", nargs='+', choices=ENGINES, help="Moteurs à mesurer", default=ENGINES)
+    parser.add_argument("--jobs", type=int, help="Nombre de processus du moteur csv-jobs", default=os.cpu_count())
+    parser.add_argument("--repeat", type=int, help="Nombre d'exécutions pour le temps de démarrage", default=5)
+    parser.add_argument("--workdir", help="Dossier pour les fichiers générés (sinon dossier temporaire)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as folder:
+        results = bench_startup(folder, args.frames, args.chains, args.repeat)
+        results += bench_throughput(folder, args.rows, args.engines, args.jobs, max(args.frames), max(args.chains))
+
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fileout:
+            json.dump(report, fileout, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
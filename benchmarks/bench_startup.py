@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Temps de démarrage à froid de ChangementReperes
+
+Le script ChangementReperes.py est lancé plusieurs fois (nouvel interpréteur à chaque fois) sur un petit fichier CSV
+(100 lignes par défaut) et le temps d'exécution total est mesuré. Le temps d'import de `networkx` (dépendance
+retirée du démarrage) est mesuré de la même façon pour comparaison.
+
+Un autre script peut être donné avec `--script` (par exemple une version antérieure de ChangementReperes.py) pour
+comparer les deux temps de démarrage.
+"""
+import os.path
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.arg_command_line import myargparse
+
+
+REPO_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CONFIG_XML = """<Config>
+  <ReferenceFrames>
+    <ReferenceFrame id="A" name="Repère A"/>
+    <ReferenceFrame id="B" name="Repère B"/>
+    <ReferenceFrame id="C" name="Repère C"/>
+  </ReferenceFrames>
+  <ChangesInReferenceFrames>
+    <Change from="A" to="B">
+      <Translation x="100" y="-50" z="2"/>
+      <Rotation angle="30" center="10,20"/>
+    </Change>
+    <Change from="B" to="C">
+      <Homothecy kh="0.02" kv="0.04" center="5,5"/>
+    </Change>
+  </ChangesInReferenceFrames>
+</Config>
+"""
+
+
+def write_csv(path, nb_rows):
+    with open(path, 'w') as fileout:
+        fileout.write("x;y;z\n")
+        for _ in range(nb_rows):
+            fileout.write("{:.3f};{:.3f};{:.3f}\n".format(random.uniform(0, 1000), random.uniform(0, 1000),
+                                                          random.uniform(0, 50)))
+
+
+def time_command(command, repeat):
+    """Return the list of wall-clock times (in seconds) of `repeat` runs of `command`"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(label, times):
+    print("{:<40} min={:.3f}s médiane={:.3f}s".format(label, min(times), statistics.median(times)))
+
+
+def main():
+    parser = myargparse(description=__doc__, lang='fr')
+    parser.add_argument("--script", help="Script ChangementReperes.py à comparer", action='append', default=[])
+    parser.add_argument("--rows", type=int, help="Nombre de lignes du fichier CSV", default=100)
+    parser.add_argument("--repeat", type=int, help="Nombre d'exécutions", default=10)
+    args = parser.parse_args()
+
+    scripts = [os.path.join(REPO_FOLDER, 'ChangementReperes.py')] + args.script
+    with tempfile.TemporaryDirectory() as folder:
+        inname_csv = os.path.join(folder, 'in.csv')
+        outname_csv = os.path.join(folder, 'out.csv')
+        config_xml = os.path.join(folder, 'config.xml')
+        write_csv(inname_csv, args.rows)
+        with open(config_xml, 'w') as fileout:
+            fileout.write(CONFIG_XML)
+
+        report("python (interpréteur seul)", time_command([sys.executable, '-c', 'pass'], args.repeat))
+        try:
+            report("import networkx", time_command([sys.executable, '-c', 'import networkx'], args.repeat))
+        except subprocess.CalledProcessError:
+            print("networkx n'est pas installé")
+        for script in scripts:
+            command = [sys.executable, script, inname_csv, outname_csv, config_xml, 'A', 'C', '--z', 'z', '--force']
+            report(os.path.relpath(script), time_command(command, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
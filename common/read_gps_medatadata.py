@@ -1,9 +1,33 @@
 """
 TODO: define an "exif_data" class?
+
+Metadata are read by `read_exif_header` directly from the leading bytes of JPEG and TIFF files (only the tags used
+by GeoRefTerrain, without decoding the image nor the other tags), with PIL as fallback for other files.
 """
+import math
+import mmap
+import os
+import struct
+
 from PIL import Image
 from PIL.ExifTags import TAGS, GPSTAGS
 
+
+EXIF_HEADER_SIZE = 1 << 17  # mapped leading bytes (an APP1 segment is at most 64 KiB)
+
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+
+# Tags extracted by read_exif_header, by IFD: code: name (same names as PIL.ExifTags)
+IFD0_TAGS = {0x0112: 'Orientation', EXIF_IFD_POINTER: 'ExifOffset', GPS_IFD_POINTER: 'GPSInfo'}
+EXIF_TAGS = {0x9004: 'DateTimeDigitized'}
+GPS_TAGS = {1: 'GPSLatitudeRef', 2: 'GPSLatitude', 3: 'GPSLongitudeRef', 4: 'GPSLongitude', 5: 'GPSAltitudeRef',
+            6: 'GPSAltitude'}
+
+# TIFF field types: code: (struct format of one value, size in bytes)
+TIFF_TYPES = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('L', 4), 5: ('LL', 8), 7: ('s', 1), 9: ('l', 4),
+              10: ('ll', 8)}
+
 def get_exif_data(image):
     """Returns a dictionary from the exif data of an PIL Image item. Also converts the GPS Tags"""
     exif_data = {}
@@ -23,25 +47,138 @@ def get_exif_data(image):
 
     return exif_data
 
+def _read_tag_value(buf, tiff, order, entry):
+    """Return the value of the IFD entry at position `entry` (tuple if the tag has several values)"""
+    tag_type, count = struct.unpack_from(order + 'HL', buf, entry + 2)
+    fmt, size = TIFF_TYPES[tag_type]
+    if size*count > 4:
+        position = tiff + struct.unpack_from(order + 'L', buf, entry + 8)[0]
+    else:
+        position = entry + 8
+    if position + size*count > len(buf):
+        raise ValueError("Valeur en dehors de l'en-tête")
+
+    if tag_type == 2:
+        # ASCII
+        return bytes(buf[position:position + count]).split(b'\0', 1)[0].decode('latin-1')
+    elif tag_type == 7:
+        # UNDEFINED
+        return bytes(buf[position:position + count])
+    values = struct.unpack_from(order + fmt*count, buf, position)
+    if len(fmt) == 2:
+        # (SIGNED) RATIONAL: (numerator, denominator) pairs
+        values = tuple(zip(values[::2], values[1::2]))
+    return values[0] if count == 1 else values
+
+
+def _read_ifd(buf, tiff, order, offset, tags):
+    """Return the dictionary name: value of the `tags` (dict code: name) found in the IFD at `offset`"""
+    position = tiff + offset
+    nb_entries = struct.unpack_from(order + 'H', buf, position)[0]
+    data = {}
+    for i in range(nb_entries):
+        entry = position + 2 + 12*i
+        tag = struct.unpack_from(order + 'H', buf, entry)[0]
+        if tag in tags:
+            try:
+                data[tags[tag]] = _read_tag_value(buf, tiff, order, entry)
+            except KeyError:
+                # Unknown field type
+                pass
+    return data
+
+
+def _find_tiff_header(buf):
+    """Return the position of the TIFF header in a JPEG (APP1 Exif segment) or TIFF file"""
+    if buf[:4] in (b'II*\0', b'MM\0*'):
+        return 0
+    if buf[:2] != b'\xff\xd8':
+        raise ValueError("Ni JPEG ni TIFF")
+    position = 2
+    while True:
+        if buf[position] != 0xff:
+            raise ValueError("Marqueur JPEG invalide")
+        marker = buf[position + 1]
+        if marker == 0xff:
+            # Fill byte
+            position += 1
+        elif 0xd0 <= marker <= 0xd7 or marker == 0x01:
+            # Markers without length
+            position += 2
+        elif marker in (0xda, 0xd9):
+            # Image data reached: no Exif segment
+            raise ValueError("Aucun segment Exif")
+        else:
+            if marker == 0xe1 and buf[position + 4:position + 10] == b'Exif\0\0':
+                return position + 10
+            position += 2 + struct.unpack_from('>H', buf, position + 2)[0]
+
+
+def read_exif_header(path):
+    """
+    Returns a dictionary like get_exif_data, limited to the orientation, date and GPS tags, read from the leading bytes of a JPEG or
+    TIFF file without PIL
+    Raise ValueError if the file is not supported or the tags are not in the leading bytes
+    """
+    with open(path, 'rb') as filein:
+        size = os.fstat(filein.fileno()).st_size
+        if size == 0:
+            raise ValueError("Fichier vide")
+        with mmap.mmap(filein.fileno(), min(size, EXIF_HEADER_SIZE), access=mmap.ACCESS_READ) as buf:
+            try:
+                tiff = _find_tiff_header(buf)
+                order = '<' if buf[tiff:tiff + 2] == b'II' else '>'
+                ifd0 = _read_ifd(buf, tiff, order, struct.unpack_from(order + 'L', buf, tiff + 4)[0], IFD0_TAGS)
+                exif_data = {}
+                if 'Orientation' in ifd0:
+                    exif_data['Orientation'] = ifd0['Orientation']
+                if 'ExifOffset' in ifd0:
+                    exif_data.update(_read_ifd(buf, tiff, order, ifd0['ExifOffset'], EXIF_TAGS))
+                if 'GPSInfo' in ifd0:
+                    exif_data['GPSInfo'] = _read_ifd(buf, tiff, order, ifd0['GPSInfo'], GPS_TAGS)
+            except (struct.error, IndexError) as e:
+                raise ValueError("En-tête tronqué : {}".format(e))
+    return exif_data
+
+
+def get_exif_data_from_file(path):
+    """Returns a dictionary like get_exif_data, read from the header of the file if possible, otherwise with PIL"""
+    try:
+        return read_exif_header(path)
+    except ValueError:
+        image = Image.open(path)
+        if not hasattr(image, '_getexif'):
+            return {}
+        return get_exif_data(image)
+
+
 def _get_if_exist(data, key):
     if key in data:
         return data[key]
 
     return None
 
+def _to_float(value):
+    """
+    Convert a rational, either a (numerator, denominator) tuple or a PIL IFDRational, to float
+    Returns None for an undefined rational (0/0 is written by cameras without GPS fix, PIL converts it to NaN)
+    """
+    if isinstance(value, tuple):
+        if value[1] == 0:
+            return None
+        return float(value[0]) / float(value[1])
+    value = float(value)
+    if math.isnan(value):
+        return None
+    return value
+
 def _convert_to_degress(value):
     """Helper function to convert the GPS coordinates stored in the EXIF to degress in float format"""
-    d0 = value[0][0]
-    d1 = value[0][1]
-    d = float(d0) / float(d1)
-
-    m0 = value[1][0]
-    m1 = value[1][1]
-    m = float(m0) / float(m1)
-
-    s0 = value[2][0]
-    s1 = value[2][1]
-    s = float(s0) / float(s1)
+    d = _to_float(value[0])
+    m = _to_float(value[1])
+    s = _to_float(value[2])
+    if d is None or m is None or s is None:
+        return None
 
     return d + (m / 60.0) + (s / 3600.0)
 
@@ -60,17 +197,33 @@ def get_lat_lon(exif_data):
 
         if gps_latitude and gps_latitude_ref and gps_longitude and gps_longitude_ref:
             lat = _convert_to_degress(gps_latitude)
+            lon = _convert_to_degress(gps_longitude)
+            if lat is None or lon is None:
+                return None, None
+
             if gps_latitude_ref != "N":
                 lat = 0 - lat
-
-            lon = _convert_to_degress(gps_longitude)
             if gps_longitude_ref != "E":
                 lon = 0 - lon
 
     return lat, lon
 
+def get_altitude(exif_data):
+    """Returns the altitude (negative below sea level), if available, from the provided exif_data"""
+    gps_info = _get_if_exist(exif_data, "GPSInfo")
+    if not gps_info:
+        return None
+    gps_altitude = _get_if_exist(gps_info, "GPSAltitude")
+    if gps_altitude is None:
+        return None
+    altitude = _to_float(gps_altitude)
+    if altitude is None:
+        return None
+    if _get_if_exist(gps_info, "GPSAltitudeRef") in (1, b'\x01'):
+        altitude = -altitude
+    return altitude
+
 
 if __name__ == "__main__":
-    image = Image.open("example/P4140017.jpg")  # load an image through PIL's Image object
-    exif_data = get_exif_data(image)
-    print(get_lat_lon(exif_data))
+    exif_data = get_exif_data_from_file("example/P4140017.jpg")
+    print(get_lat_lon(exif_data), get_altitude(exif_data))
@@ -4,32 +4,85 @@ TODO:
 * fix bug with attribute isValid (on QLineEdit)
 """
 
+import argparse
 from csv import DictReader
 import logging
+import logging.handlers
+import multiprocessing
 import os.path
 from PyQt4 import QtGui, QtCore
+import queue
 import sys
 
 from common.qt_log_in_textbrowser import MyQWidget, ConsoleWindowLogHandler
 
-from ChangementReperes import ReferenceFrameConfig, launch_main
+from ChangementReperes import DEFAULT_CHUNK_SIZE, ReferenceFrameConfig, ReferenceFrameError, TransformCancelled, \
+    TransformStats, launch_main
 
 
 NO_VALUE = "(aucun)"
 
 
+def run_transformation(args, messages, cancel_event):
+    """
+    Run launch_main in a child process
+    Log records, progress dictionaries ('progress', dict) and the final status ('done', status, message)
+    are sent to the parent through the `messages` queue.
+    """
+    child_logger = logging.getLogger('ChangementReperes.child')
+    child_logger.setLevel(logging.DEBUG)
+    child_logger.addHandler(logging.handlers.QueueHandler(messages))
+    stats = TransformStats(progress_callback=lambda progress: messages.put(('progress', progress)),
+                           cancel_event=cancel_event)
+    try:
+        launch_main(args, child_logger, stats)
+        messages.put(('done', 'ok', None))
+    except TransformCancelled as e:
+        messages.put(('done', 'cancelled', str(e)))
+    except SystemExit as e:
+        messages.put(('done', 'error', str(e)))
+    except Exception as e:
+        messages.put(('done', 'error', "{}: {}".format(type(e).__name__, e)))
+
+
 class Worker(QtCore.QThread):
-    def __init__(self, func, args):
+    """
+    Run the transformation in a child process, so that the window stays responsive, and relay its messages:
+    log records are handled by `logger`, progress and end of the run are emitted as signals
+    "progress(PyQt_PyObject)" (dictionary of TransformStats.progress) and "transformDone(QString, QString)"
+    (status 'ok', 'cancelled' or 'error', and message).
+    """
+    def __init__(self, args):
         super(Worker, self).__init__()
-        self.func = func
-        self.args = args
+        self.messages = multiprocessing.Queue()
+        self.cancel_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=run_transformation,
+                                               args=(args, self.messages, self.cancel_event), daemon=True)
+
+    def cancel(self):
+        """Stop the transformation at the end of the current block"""
+        self.cancel_event.set()
 
     def run(self):
-        try:
-            self.func(*self.args)
-        except SystemExit as e:
-            logger.fatal(e)
-            logger.fatal("L'exécution a échoué à cause de l'erreur ci-dessus")
+        self.process.start()
+        while True:
+            try:
+                message = self.messages.get(timeout=0.5)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    self.emit(QtCore.SIGNAL("transformDone(QString, QString)"), 'error',
+                              "Le processus de calcul s'est arrêté (code {})".format(self.process.exitcode))
+                    break
+                continue
+            if isinstance(message, logging.LogRecord):
+                logger.handle(message)
+            elif message[0] == 'progress':
+                self.emit(QtCore.SIGNAL("progress(PyQt_PyObject)"), message[1])
+            else:
+                _, status, text = message
+                self.emit(QtCore.SIGNAL("transformDone(QString, QString)"), status, text or "")
+                break
+        self.process.join()
 
 
 class ExecutingWindow(MyQWidget):
@@ -45,6 +98,13 @@ class ExecutingWindow(MyQWidget):
         self._console = QtGui.QTextBrowser(self)
         self.vbox.addWidget(self._console)
 
+        # Progress
+        self.progress_bar = QtGui.QProgressBar(self)
+        self.progress_bar.setRange(0, 0)  # busy indicator until the size of the input is known
+        self.vbox.addWidget(self.progress_bar)
+        self.progress_label = QtGui.QLabel("Démarrage...")
+        self.vbox.addWidget(self.progress_label)
+
         # Buttons
         self.button_cancel = QtGui.QPushButton('Annuler', self)
         self.button_quit = QtGui.QPushButton('Quitter', self)
@@ -56,20 +116,66 @@ class ExecutingWindow(MyQWidget):
 
         self.setLayout(self.vbox)
 
-        # Connexions
-        self.connect(self.button_cancel, QtCore.SIGNAL('clicked()'), self.close)
-        self.connect(self.button_quit, QtCore.SIGNAL('clicked()'), QtCore.QCoreApplication.instance().quit)
-
-        # Thread
-        self.worker = Worker(launch_main, (args, logger))
-        self.worker.start()
-
         # Console handler
         dummyEmitter = QtCore.QObject()
         self.connect(dummyEmitter, QtCore.SIGNAL("logMsg(QString)"), self._console.append)
         consoleHandler = ConsoleWindowLogHandler(dummyEmitter)
         logger.addHandler(consoleHandler)
 
+        # Thread
+        self.running = True
+        self.worker = Worker(args)
+        self.connect(self.worker, QtCore.SIGNAL("progress(PyQt_PyObject)"), self.update_progress)
+        self.connect(self.worker, QtCore.SIGNAL("transformDone(QString, QString)"), self.transform_done)
+
+        # Connexions
+        self.connect(self.button_cancel, QtCore.SIGNAL('clicked()'), self.cancel)
+        self.connect(self.button_quit, QtCore.SIGNAL('clicked()'), QtCore.QCoreApplication.instance().quit)
+
+        self.worker.start()
+
+    def update_progress(self, progress):
+        """Show rows, rate, bytes read and estimated remaining time"""
+        text = "{} lignes ({:.0f} lignes/s)".format(progress['rows'], progress['rows_per_s'])
+        if progress['bytes_read'] is not None:
+            self.progress_bar.setRange(0, 1000)
+            self.progress_bar.setValue(int(1000*progress['bytes_read']/max(progress['bytes_total'], 1)))
+            text += ", {:.1f} / {:.1f} Mo lus".format(progress['bytes_read']/1e6, progress['bytes_total']/1e6)
+        if progress['eta_s'] is not None:
+            text += ", reste environ {:.0f} s".format(progress['eta_s'])
+        self.progress_label.setText(text)
+
+    def transform_done(self, status, message):
+        self.running = False
+        self.progress_bar.setRange(0, 1000)
+        if status == 'ok':
+            self.progress_bar.setValue(1000)
+            self.progress_label.setText("Terminé")
+        elif status == 'cancelled':
+            self.progress_label.setText("Annulé")
+        else:
+            logger.fatal(message)
+            logger.fatal("L'exécution a échoué à cause de l'erreur ci-dessus")
+            self.progress_label.setText("Échec")
+        self.button_cancel.setText('Fermer')
+        self.button_cancel.setEnabled(True)
+
+    def cancel(self):
+        """Cancel the running transformation, or close the window once it is finished"""
+        if self.running:
+            self.worker.cancel()
+            self.button_cancel.setEnabled(False)
+            self.progress_label.setText("Annulation...")
+        else:
+            self.close()
+
+    def closeEvent(self, event):
+        if self.running:
+            # The child process stops at the end of the current block
+            self.worker.cancel()
+            self.worker.wait()
+        event.accept()
+
     def scroll_down(self):
         self._console.verticalScrollBar().setValue(self._console.verticalScrollBar().maximum())
 
@@ -299,7 +405,11 @@ class Main(MyQWidget):
                     pass
 
     def find_reference_frames(self):
-        self.ref_frame_config = ReferenceFrameConfig(self.config_xml.text(), logger)
+        try:
+            self.ref_frame_config = ReferenceFrameConfig.load(self.config_xml.text(), logger)
+        except ReferenceFrameError as e:
+            logger.fatal(e)
+            return
 
         # Source
         self.source.clear()
@@ -321,8 +431,7 @@ class Main(MyQWidget):
 
 
     def open_popup(self):
-        class args:
-            pass
+        args = argparse.Namespace()  # sent to a child process
         args.inname_csv = self.inname_csv.text()
         args.outname_csv = self.outname_csv.text()
         args.config_xml = self.config_xml.text()
@@ -336,6 +445,17 @@ class Main(MyQWidget):
         else:
             args.z = None
         args.digits = int(self.digits.text())  # FIXME: integer validation through regex?
+        args.chunk_size = DEFAULT_CHUNK_SIZE
+        args.jobs = 1
+        args.incremental = False
+        args.passthrough = False
+        args.compact = None
+        args.sort = None
+        args.tile_index = None
+        args.rejects = False
+        args.no_cache = False
+        args.stats_json = None
+        args.layer = None
         args.verbose = True
         args.force = False
 
@@ -13,7 +13,7 @@ import sys
 
 from common.qt_log_in_textbrowser import MyQWidget, ConsoleWindowLogHandler
 
-from GeoRefTerrain import Gpx, launch_main, list_images, logger, Picture
+from GeoRefTerrain import DEFAULT_JOBS, Gpx, launch_main, list_images, logger, open_metadata_cache, Picture
 
 
 DEBUG = True
@@ -272,6 +272,9 @@ class Main(MyQWidget):
 
         args.date_type = DEFAULT_INDEX_METHOD+1
         args.decal_temps = 0.0
+        args.jobs = DEFAULT_JOBS
+        args.no_cache = False
+        args.rebuild_cache = False
 
         if args.interpolation:
             self.w = InterpolateDialog(args)
@@ -295,7 +298,12 @@ class InterpolateDialog(QtGui.QWidget):
 
         self.resize(700, 400)
 
-        images = list_images(args.inname_folder, args.no_folder, args.date_type)
+        cache = open_metadata_cache(args)
+        try:
+            images = list_images(args.inname_folder, args.no_folder, args.date_type, jobs=args.jobs, cache=cache)
+        finally:
+            if cache is not None:
+                cache.close()
         nrows = len(images)
 
         layout = QtGui.QVBoxLayout(self)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Service local de changement de repère
+
+Serveur HTTP (sur localhost) qui garde en mémoire les configurations de repères déjà lues et transforme des lots de
+coordonnées, ce qui évite à chaque appel le démarrage de l'interpréteur, les imports et la lecture du fichier xml.
+
+Requête : POST /transform?config=<fichier xml>&source=<repère>&target=<repère>&format=<bin|csv>
+* format=bin : le corps contient des float64 petit-boutistes x, y, [z] (paramètre `columns`, 2 ou 3, par défaut 3),
+la réponse a le même format ;
+* format=csv : le corps est un fichier CSV (paramètres `sep`, `x`, `y`, `z` et `digits` comme pour
+ChangementReperes.py, `passthrough=1` pour recopier les autres champs tels quels), la réponse est le CSV transformé.
+
+Les requêtes simultanées portant sur le même changement de repère sont regroupées en un seul calcul vectorisé.
+GET /status renvoie les configurations chargées et les compteurs du service (JSON).
+"""
+import argparse
+import http.server
+import io
+import json
+import logging
+import os.path
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+from ChangementReperes import DEFAULT_CHUNK_SIZE, LOG_FORMAT, ReferenceFrameConfig, ReferenceFrameError, \
+    transform_csv_stream
+
+
+DEFAULT_PORT = 8765
+COALESCE_DELAY = 0.002  # seconds waited for other requests before computing a batch
+COALESCE_MAX_POINTS = 1000000
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigRegistry:
+    """
+    Compiled configurations kept in memory, by absolute path of the xml file
+    A configuration is reloaded if its file has been modified.
+    """
+    def __init__(self, use_cache=True):
+        self.use_cache = use_cache
+        self._configs = {}  # path: (modification time, ReferenceFrameConfig)
+        self._lock = threading.Lock()
+
+    def get(self, config_xml):
+        path = os.path.abspath(config_xml)
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            try:
+                config_mtime, config = self._configs[path]
+                if config_mtime == mtime:
+                    return config
+            except KeyError:
+                pass
+            logger.info("Chargement de la configuration {}".format(path))
+            config = ReferenceFrameConfig.load(path, logger, use_cache=self.use_cache)
+            self._configs[path] = (mtime, config)
+            return config
+
+    def paths(self):
+        with self._lock:
+            return list(self._configs)
+
+
+class TransformBatcher:
+    """
+    Group concurrent requests for the same change of reference frame into a single vectorized call
+    A dispatcher thread takes the first pending job, waits `delay` seconds for other ones (up to `max_points`),
+    then concatenates the points of each group, transforms them at once and splits the result.
+    """
+    def __init__(self, delay=COALESCE_DELAY, max_points=COALESCE_MAX_POINTS):
+        self.delay = delay
+        self.max_points = max_points
+        self.nb_requests = 0
+        self.nb_batches = 0
+        self._jobs = queue.Queue()
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def transform(self, key, transformation, points):
+        """Return transformed points (array n rows, columns x, y, [z]), `key` identifies the change of reference frame"""
+        job = {'key': (key, points.shape[1]), 'transformation': transformation, 'points': points,
+               'done': threading.Event()}
+        self._jobs.put(job)
+        job['done'].wait()
+        if 'error' in job:
+            raise job['error']
+        return job['result']
+
+    def _dispatch(self):
+        while True:
+            jobs = [self._jobs.get()]
+            nb_points = len(jobs[0]['points'])
+            deadline = time.perf_counter() + self.delay
+            while nb_points < self.max_points:
+                try:
+                    job = self._jobs.get(timeout=max(0., deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                nb_points += len(job['points'])
+
+            groups = {}
+            for job in jobs:
+                groups.setdefault(job['key'], []).append(job)
+            for group in groups.values():
+                try:
+                    points = np.concatenate([job['points'] for job in group])
+                    result = group[0]['transformation'].apply_to_points(points, points)
+                    offsets = np.cumsum([len(job['points']) for job in group])[:-1]
+                    for job, job_result in zip(group, np.split(result, offsets)):
+                        job['result'] = job_result
+                except Exception as e:
+                    for job in group:
+                        job['error'] = e
+                for job in group:
+                    job['done'].set()
+            self.nb_requests += len(jobs)
+            self.nb_batches += len(groups)
+
+
+class CoalescedTransformation:
+    """Transformation with the interface of AffineTransformation.apply, computed through a TransformBatcher"""
+    def __init__(self, batcher, key, transformation):
+        self.batcher = batcher
+        self.key = key
+        self.transformation = transformation
+
+    def apply(self, x, y, z=None):
+        points = np.column_stack([x, y] if z is None else [x, y, z])
+        points = self.batcher.transform(self.key, self.transformation, points)
+        return points[:, 0], points[:, 1], None if z is None else points[:, 2]
+
+
+class TransformRequestHandler(http.server.BaseHTTPRequestHandler):
+    registry = None
+    batcher = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_text(self, code, text, content_type='text/plain; charset=utf-8'):
+        content = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path != '/status':
+            self.send_text(404, "Inconnu : {}".format(self.path))
+            return
+        self.send_text(200, json.dumps({
+            'configs': self.registry.paths(),
+            'requests': self.batcher.nb_requests,
+            'batches': self.batcher.nb_batches,
+        }), 'application/json')
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/transform':
+            self.send_text(404, "Inconnu : {}".format(self.path))
+            return
+        params = dict(urllib.parse.parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            config = self.registry.get(params['config'])
+            _, transformation = config.find_transformation(params['source'], params['target'])
+            key = (os.path.abspath(params['config']), params['source'], params['target'])
+
+            if params.get('format', 'bin') == 'bin':
+                nb_columns = int(params.get('columns', 3))
+                if nb_columns not in (2, 3):
+                    raise ValueError("Nombre de colonnes invalide : {} (2 ou 3)".format(nb_columns))
+                points = np.frombuffer(body, dtype='<f8').reshape(-1, nb_columns).copy()
+                if len(points) > 0:
+                    points = self.batcher.transform(key, transformation, points)
+                content = points.astype('<f8').tobytes()
+                content_type = 'application/octet-stream'
+            else:
+                args = argparse.Namespace(inname_csv='<requête>', sep=params.get('sep', ';'), x=params.get('x', 'x'),
+                                          y=params.get('y', 'y'), z=params.get('z'),
+                                          digits=int(params.get('digits', 4)), chunk_size=DEFAULT_CHUNK_SIZE,
+                                          passthrough=params.get('passthrough') == '1')
+                out_csv = io.StringIO(newline='')
+                transform_csv_stream(io.StringIO(body.decode('utf-8'), newline=''), out_csv,
+                                     CoalescedTransformation(self.batcher, key, transformation), args, logger)
+                content = out_csv.getvalue().encode('utf-8')
+                content_type = 'text/csv; charset=utf-8'
+        except KeyError as e:
+            self.send_text(400, "Paramètre manquant : {}".format(e))
+            return
+        except (ReferenceFrameError, OSError, ValueError) as e:
+            self.send_text(400, str(e))
+            return
+        except SystemExit as e:
+            # Errors of ChangementReperes functions reading files
+            self.send_text(400, str(e))
+            return
+        except Exception as e:
+            # Unexpected error (possibly raised again by TransformBatcher.transform): the client still gets a response
+            logger.exception("Erreur lors du traitement de la requête {}".format(self.path))
+            self.send_text(500, "Erreur interne : {}".format(e))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class TransformServer(http.server.ThreadingHTTPServer):
+    request_queue_size = 128  # many batch jobs may connect at the same time
+    daemon_threads = True
+
+
+def request_transform(points, config_xml, source, target, url="http://127.0.0.1:{}".format(DEFAULT_PORT)):
+    """
+    Client: transform an array of points (n rows, columns x, y, [z]) with a running service
+    Raise ReferenceFrameError with the message of the service if the request is rejected
+    """
+    points = np.ascontiguousarray(points, dtype='<f8')
+    query = urllib.parse.urlencode({'config': os.path.abspath(config_xml), 'source': source, 'target': target,
+                                    'format': 'bin', 'columns': points.shape[1]})
+    request = urllib.request.Request("{}/transform?{}".format(url, query), data=points.tobytes(), method='POST')
+    try:
+        with urllib.request.urlopen(request) as response:
+            return np.frombuffer(response.read(), dtype='<f8').reshape(-1, points.shape[1])
+    except urllib.error.HTTPError as e:
+        raise ReferenceFrameError(e.read().decode('utf-8'))
+
+
+def launch_main(args, logger):
+    TransformRequestHandler.registry = ConfigRegistry(use_cache=not args.no_cache)
+    TransformRequestHandler.batcher = TransformBatcher(delay=args.delay/1000)
+    for config_xml in args.config_xml:
+        try:
+            TransformRequestHandler.registry.get(config_xml)
+        except ReferenceFrameError as e:
+            sys.exit(str(e))
+
+    server = TransformServer((args.host, args.port), TransformRequestHandler)
+    logger.info("Service de changement de repère sur http://{}:{}".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Arrêt du service")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    from common.arg_command_line import myargparse
+    parser = myargparse(description=__doc__, add_args=['verbose'], lang='fr')
+    parser.add_argument("config_xml", nargs='*', help="Fichiers de configuration xml des repères à charger au démarrage")
+    parser.add_argument("--host", help="Adresse d'écoute (locale uniquement de préférence)", default='127.0.0.1')
+    parser.add_argument("--port", type=int, help="Port d'écoute", default=DEFAULT_PORT)
+    parser.add_argument("--delay", type=float, help="Attente (en ms) pour regrouper les requêtes simultanées",
+                        default=COALESCE_DELAY*1000)
+    parser.add_argument("--no-cache", help="Relire les fichiers xml sans utiliser le cache de configuration",
+                        action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format=LOG_FORMAT)
+    sys.exit(launch_main(args, logger))